@@ -0,0 +1,171 @@
+# benchmarks/corpus.py
+"""
+Фиксированный корпус документов для бенчмарков.
+Файлы генерируются детерминированно (без случайности и дат), поэтому
+одинаковы на любой машине и в любом коммите.
+"""
+import io
+import random
+
+LOREM = (
+    "Lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua Ut enim ad minim veniam quis nostrud"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(LOREM) for _ in range(words)).capitalize() + "."
+
+
+def make_text_pdf(pages: int, lines_per_page: int = 40, seed: int = 1) -> bytes:
+    """
+    Текстовый PDF со шрифтом Helvetica, собранный вручную:
+    pypdf умеет только читать текст, но не рисовать его.
+    """
+    rng = random.Random(seed)
+    objects = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    catalog_id = add(b"")  # заполним после страниц
+    pages_id = add(b"")
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page_no in range(pages):
+        lines = [f"Page {page_no + 1} header"] + [_sentence(rng) for _ in range(lines_per_page)]
+        ops = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+        for line in lines:
+            safe = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({safe}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, font_id, content_id)
+        ))
+
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % num + obj + b"\nendobj\n")
+    xref_pos = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_pos))
+    return out.getvalue()
+
+
+def make_scanned_pdf(pages: int, seed: int = 3) -> bytes:
+    """
+    «Скан»: PDF без текстового слоя — уходит в OCR постранично.
+    На каждой странице свой векторный рисунок (полосы-«строки» разной длины),
+    чтобы страницы не совпадали и в OCR уходили все.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject
+
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    for _ in range(pages):
+        page = writer.add_blank_page(width=595, height=842)
+        ops = ["0 g"]
+        for line in range(40):
+            ops.append(f"50 {780 - line * 18} {rng.randint(120, 495)} 8 re f")
+        stream = DecodedStreamObject()
+        stream.set_data("\n".join(ops).encode("ascii"))
+        page.replace_contents(stream)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def make_docx(paragraphs: int, seed: int = 2) -> bytes:
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            doc.add_heading(f"Section {i // 20 + 1}", level=1)
+        doc.add_paragraph(_sentence(rng, 25))
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def make_pptx(slides: int, seed: int = 3) -> bytes:
+    from pptx import Presentation
+
+    rng = random.Random(seed)
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {i + 1}"
+        slide.placeholders[1].text = "\n".join(_sentence(rng) for _ in range(5))
+    buf = io.BytesIO()
+    prs.save(buf)
+    return buf.getvalue()
+
+
+def make_photo(width: int = 3000, height: int = 4000, seed: int = 4) -> bytes:
+    """«Фото документа»: светлый фон с тёмными полосами-строками, JPEG как с камеры телефона."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), (235, 232, 225))
+    draw = ImageDraw.Draw(img)
+    y = 200
+    while y < height - 200:
+        x_end = rng.randint(width // 2, width - 200)
+        draw.rectangle([200, y, x_end, y + 30], fill=(40, 40, 40))
+        y += 80
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+def make_photo_pdf(pages: int, duplicates: int = 2) -> bytes:
+    """
+    «Скан с телефона» в PDF: по картинке на страницу, последние duplicates страниц —
+    повторно снятые (пережатые и чуть светлее) копии первых, как бывает при досъёмке.
+    """
+    from PIL import Image, ImageEnhance
+
+    images = [Image.open(io.BytesIO(make_photo(1240, 1754, seed=10 + i))) for i in range(pages - duplicates)]
+    for i in range(duplicates):
+        copy = ImageEnhance.Brightness(images[i]).enhance(1.05)
+        buf = io.BytesIO()
+        copy.save(buf, format="JPEG", quality=70)
+        images.append(Image.open(io.BytesIO(buf.getvalue())))
+    out = io.BytesIO()
+    images[0].save(out, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return out.getvalue()
+
+
+def build_corpus() -> list[dict]:
+    """
+    Список документов: name — для отчёта, kind — photo/document,
+    file_name — имя, по расширению которого бот выбирает парсер.
+    """
+    return [
+        {"name": "pdf_text_10p", "kind": "document", "file_name": "lecture.pdf", "data": make_text_pdf(10)},
+        {"name": "pdf_text_100p", "kind": "document", "file_name": "book.pdf", "data": make_text_pdf(100)},
+        {"name": "pdf_scan_12p", "kind": "document", "file_name": "scan.pdf", "data": make_scanned_pdf(12)},
+        {"name": "docx_200par", "kind": "document", "file_name": "notes.docx", "data": make_docx(200)},
+        {"name": "pptx_30sl", "kind": "document", "file_name": "slides.pptx", "data": make_pptx(30)},
+        {"name": "photo_12mp", "kind": "photo", "file_name": None, "data": make_photo()},
+        {"name": "pdf_photos_8p", "kind": "document", "file_name": "photos.pdf", "data": make_photo_pdf(8)},
+    ]
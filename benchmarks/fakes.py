@@ -0,0 +1,216 @@
+# benchmarks/fakes.py
+"""
+Локальные заглушки внешних сервисов для бенчмарков:
+Telegram Bot API (getFile + скачивание), Yandex OCR, Yandex/OpenRouter completion
+и минимальное S3-совместимое хранилище (HEAD/PUT/GET объекта).
+
+Всё живёт в одном aiohttp-приложении на 127.0.0.1, задержки ответов настраиваются,
+чтобы прогон не зависел от сети и был сравним между коммитами.
+
+quota_rps > 0 включает квоты как у настоящих API: запросы к OCR, LLM и S3 сверх
+quota_rps в секунду (на каждый сервис отдельно) получают 429 с Retry-After
+(S3 — 503 SlowDown), чтобы проверить лимиты скорости и повторы бота.
+"""
+import time
+import json
+import asyncio
+import hashlib
+from collections import deque
+
+from aiohttp import web
+
+# Ответ «модели»: фиксированное дерево, чтобы разбор и выгрузка были одинаковыми от прогона к прогону
+FAKE_TREE = {
+    "title": "Бенчмарк",
+    "nodes": [
+        {
+            "title": f"Раздел {i}",
+            "children": [{"title": f"Пункт {i}.{j}", "children": []} for j in range(4)],
+        }
+        for i in range(6)
+    ],
+}
+
+
+def _fake_answer(prompt: str) -> str:
+    # Заголовок зависит от промпта: разные документы дают разные карты
+    # (и разные ключи в S3), один и тот же документ — всегда одну и ту же
+    tree = dict(FAKE_TREE, title=f"Бенчмарк {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]}")
+    return json.dumps(tree, ensure_ascii=False)
+
+
+class FakeServices:
+    def __init__(self, llm_latency: float = 0.05, ocr_latency: float = 0.02, quota_rps: float = 0):
+        self.llm_latency = llm_latency
+        self.ocr_latency = ocr_latency
+        self.quota_rps = quota_rps
+        # сервис -> время принятых запросов за последнюю секунду
+        self._windows = {}
+        # file_id -> bytes, которые «лежат» на серверах Telegram
+        self.files = {}
+        # "bucket/key" -> (bytes, headers)
+        self.objects = {}
+        self.requests = {"getFile": 0, "download": 0, "ocr": 0, "ocr_bytes": 0, "yandex": 0, "openrouter": 0, "s3_put": 0, "throttled": 0}
+        self._runner = None
+        self.base_url = None
+
+    def add_file(self, file_id: str, data: bytes):
+        self.files[file_id] = data
+
+    # --- Telegram ---
+
+    async def _get_file(self, request):
+        self.requests["getFile"] += 1
+        data = await request.post()
+        if not data:
+            data = await request.json()
+        file_id = data["file_id"]
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files[file_id]),
+                "file_path": f"documents/{file_id}",
+            },
+        })
+
+    async def _download(self, request):
+        self.requests["download"] += 1
+        file_id = request.match_info["path"].split("/")[-1]
+        return web.Response(body=self.files[file_id])
+
+    # --- Yandex OCR ---
+
+    async def _ocr(self, request):
+        self.requests["ocr"] += 1
+        raw = await request.read()
+        self.requests["ocr_bytes"] += len(raw)
+        body = json.loads(raw)
+        await asyncio.sleep(self.ocr_latency)
+        size = len(body.get("content", ""))
+        return web.json_response({
+            "result": {"textAnnotation": {"fullText": f"Распознанный текст ({size} байт base64)"}}
+        })
+
+    # --- LLM ---
+
+    async def _yandex(self, request):
+        self.requests["yandex"] += 1
+        body = await request.json()
+        text = _fake_answer(body["messages"][-1]["text"])
+        if not body.get("completionOptions", {}).get("stream"):
+            await asyncio.sleep(self.llm_latency)
+            return web.json_response({"result": {"alternatives": [{"message": {"text": text}}]}})
+
+        # NDJSON с накопленным текстом, как у Yandex
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        steps = 5
+        for i in range(1, steps + 1):
+            await asyncio.sleep(self.llm_latency / steps)
+            part = text[: len(text) * i // steps]
+            line = json.dumps({"result": {"alternatives": [{"message": {"text": part}}]}}, ensure_ascii=False)
+            await resp.write((line + "\n").encode("utf-8"))
+        return resp
+
+    async def _openrouter(self, request):
+        self.requests["openrouter"] += 1
+        body = await request.json()
+        text = _fake_answer(body["messages"][-1]["content"])
+        if not body.get("stream"):
+            await asyncio.sleep(self.llm_latency)
+            return web.json_response({"choices": [{"message": {"content": text}}]})
+
+        # SSE с дельтами, как у OpenRouter
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        steps = 5
+        for i in range(steps):
+            await asyncio.sleep(self.llm_latency / steps)
+            part = text[len(text) * i // steps: len(text) * (i + 1) // steps]
+            chunk = json.dumps({"choices": [{"delta": {"content": part}}]}, ensure_ascii=False)
+            await resp.write(f"data: {chunk}\n\n".encode("utf-8"))
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    # --- S3 ---
+
+    async def _s3_head(self, request):
+        key = f"{request.match_info['bucket']}/{request.match_info['key']}"
+        if key not in self.objects:
+            return web.Response(status=404)
+        return web.Response(status=200)
+
+    async def _s3_put(self, request):
+        self.requests["s3_put"] += 1
+        key = f"{request.match_info['bucket']}/{request.match_info['key']}"
+        self.objects[key] = (await request.read(), dict(request.headers))
+        return web.Response(status=200, headers={"ETag": '"fake"'})
+
+    async def _s3_get(self, request):
+        key = f"{request.match_info['bucket']}/{request.match_info['key']}"
+        if key not in self.objects:
+            return web.Response(status=404)
+        return web.Response(body=self.objects[key][0])
+
+    # --- квоты ---
+
+    @staticmethod
+    def _service(request) -> str | None:
+        path = request.path
+        if path.startswith("/bot") or path.startswith("/file/"):
+            return None  # Telegram квотами не ограничиваем
+        if path in ("/ocr", "/yandex", "/openrouter"):
+            return path[1:]
+        return "s3"
+
+    def _over_quota(self, service: str) -> bool:
+        window = self._windows.setdefault(service, deque())
+        now = time.monotonic()
+        while window and now - window[0] >= 1:
+            window.popleft()
+        if len(window) >= self.quota_rps:
+            return True
+        window.append(now)
+        return False
+
+    @web.middleware
+    async def _quota(self, request, handler):
+        service = self._service(request)
+        if self.quota_rps and service and self._over_quota(service):
+            self.requests["throttled"] += 1
+            await request.read()
+            if service == "s3":
+                body = "<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+                return web.Response(status=503, text=body, content_type="application/xml")
+            return web.json_response({"error": "rate limit exceeded"}, status=429, headers={"Retry-After": "1"})
+        return await handler(request)
+
+    # --- запуск ---
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024, middlewares=[self._quota])
+        app.router.add_post("/bot{token}/getFile", self._get_file)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._download)
+        app.router.add_post("/ocr", self._ocr)
+        app.router.add_post("/yandex", self._yandex)
+        app.router.add_post("/openrouter", self._openrouter)
+        # S3 в path-style: /<bucket>/<key>; маршруты Telegram выше, поэтому матчатся раньше
+        app.router.add_route("HEAD", "/{bucket}/{key:.+}", self._s3_head)
+        app.router.add_put("/{bucket}/{key:.+}", self._s3_put)
+        app.router.add_get("/{bucket}/{key:.+}", self._s3_get, allow_head=False)
+        return app
+
+    async def start(self, port: int = 0) -> str:
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        actual_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{actual_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
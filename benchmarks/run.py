@@ -0,0 +1,327 @@
+# benchmarks/run.py
+"""
+Бенчмарк конвейера «скачивание → извлечение текста → LLM → выгрузка в S3».
+
+Гоняет настоящий код из services/ против локальных заглушек (benchmarks/fakes.py)
+на фиксированном корпусе (benchmarks/corpus.py) и печатает перцентили по стадиям,
+пропускную способность и пиковую память. Сеть не нужна.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --iterations 10 --concurrency 8 --out bench.json
+    python -m benchmarks.run --compare bench.json   # сравнить с прошлым прогоном
+    python -m benchmarks.run --quota-rps 5          # заглушки отвечают 429 сверх квоты
+
+Кэши текста и карт отключены, а «бакет» очищается между итерациями —
+каждая итерация проходит все стадии целиком.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fakes import FakeServices
+
+BOT_TOKEN = "123456:BENCHMARK"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _configure_env(base_url: str, workdir: str):
+    """
+    config.py читает окружение при импорте, поэтому настраиваем его
+    до первого импорта services.* — все внешние адреса смотрят на заглушки.
+    """
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "YANDEX_API_KEY": "bench",
+        "YANDEX_FOLDER_ID": "bench",
+        "YANDEX_URL": "gpt://bench/yandexgpt",
+        "YANDEX_API_URL": f"{base_url}/yandex",
+        "YANDEX_OCR_URL": f"{base_url}/ocr",
+        "OPENROUTER_API_KEY": "bench",
+        "OPENROUTER_BASE_URL": f"{base_url}/openrouter",
+        "YC_ACCESS_KEY_ID": "bench",
+        "YC_SECRET_ACCESS_KEY": "bench",
+        "YC_BUCKET_NAME": "bench",
+        "YC_S3_ENDPOINT": base_url,
+        "TEXT_CACHE_DIR": os.path.join(workdir, "text"),
+        "MARKMAP_CACHE_ENABLED": "0",
+        "MAPS_DB_PATH": os.path.join(workdir, "maps.db"),
+        "DOWNLOAD_SPOOL_DIR": os.path.join(workdir, "spool"),
+    })
+    os.makedirs(os.environ["DOWNLOAD_SPOOL_DIR"], exist_ok=True)
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summary(values: list) -> dict:
+    return {
+        "n": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _make_message(bot, doc: dict, file_id: str):
+    from aiogram.types import Message
+
+    data = {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+    }
+    if doc["kind"] == "photo":
+        data["photo"] = [{
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "width": 3000,
+            "height": 4000,
+            "file_size": len(doc["data"]),
+        }]
+    else:
+        data["document"] = {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_name": doc["file_name"],
+            "file_size": len(doc["data"]),
+        }
+    return Message.model_validate(data).as_(bot)
+
+
+async def _run(args) -> dict:
+    # Кэши, база и временные файлы скачиваний — в каталоге, который удаляется после прогона
+    with tempfile.TemporaryDirectory(prefix="markmap-bench-") as workdir:
+        return await _run_in(args, workdir)
+
+
+async def _run_in(args, workdir: str) -> dict:
+    fakes = FakeServices(llm_latency=args.llm_latency, ocr_latency=args.ocr_latency, quota_rps=args.quota_rps)
+    port = _free_port()
+    _configure_env(f"http://127.0.0.1:{port}", workdir)
+
+    # Импорты после настройки окружения
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from services import s3_client
+    from services.document_text import (
+        _extract_text_from_file,
+        _extract_text_from_pdf,
+        _guess_extension,
+        _preprocess_image,
+        _prepare_pdf_for_ocr,
+        file_info_from_message,
+    )
+    from services.downloads import download_file
+    from services.http_client import close_clients
+    from services.llm import generate_markmap, markmap_tree
+    from services.parser_pool import shutdown_parsers
+    from services.storage import upload_tree_to_s3
+
+    await fakes.start(port)
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(fakes.base_url)))
+
+    corpus = build_corpus()
+    for doc in corpus:
+        fakes.add_file(doc["name"], doc["data"])
+
+    samples: dict = {}
+
+    def record(stage: str, seconds: float):
+        samples.setdefault(stage, []).append(seconds)
+
+    # Подготовка картинок к OCR — отдельно от сети: размеры тел запросов
+    # детерминированы, время — чистый CPU (в одном процессе, без пула)
+    ocr_payload = {}
+    preprocess_samples = {}
+    for doc in corpus:
+        if doc["kind"] == "photo":
+            prepare = lambda data: ([("JPEG", _preprocess_image(data))], 0)
+        elif doc["file_name"].endswith(".pdf") and not _extract_text_from_pdf(doc["data"]):
+            prepare = _prepare_pdf_for_ocr
+        else:
+            continue
+        for _ in range(max(1, args.iterations)):
+            t = time.perf_counter()
+            pieces, dropped = prepare(doc["data"])
+            preprocess_samples.setdefault(f"preprocess:{doc['name']}", []).append(time.perf_counter() - t)
+        ocr_payload[doc["name"]] = {
+            "bytes_in": len(doc["data"]),
+            "bytes_out": sum(len(body) for _, body in pieces),
+            "requests": len(pieces),
+            "dropped_pages": dropped,
+        }
+
+    async def no_progress(titles):
+        pass
+
+    async def one(doc: dict):
+        file_info = file_info_from_message(_make_message(bot, doc, doc["name"]))
+        kind = "photo" if doc["kind"] == "photo" else _guess_extension(doc["file_name"]).lstrip(".")
+        started = time.perf_counter()
+
+        t = time.perf_counter()
+        downloaded = await download_file(bot, file_info["file_id"], file_info["file_size"])
+        record("download", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        with downloaded:
+            text, _ = await _extract_text_from_file(file_info, downloaded)
+        record(f"extract:{kind}", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        result = await generate_markmap(
+            text,
+            "Средняя",
+            model_name=args.model,
+            use_cache=False,
+            on_progress=no_progress if args.stream else None,
+        )
+        record("llm", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        await upload_tree_to_s3(markmap_tree(result["title"], result["nodes"]))
+        record("upload", time.perf_counter() - t)
+
+        record(f"total:{doc['name']}", time.perf_counter() - started)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(doc):
+        async with semaphore:
+            await one(doc)
+
+    # Прогрев: пул процессов парсеров, TLS/keep-alive сессии, импорт парсеров
+    await asyncio.gather(*(one(doc) for doc in corpus))
+    samples.clear()
+
+    samples.update(preprocess_samples)
+
+    tracemalloc.start()
+    wall_started = time.perf_counter()
+    for _ in range(args.iterations):
+        fakes.objects.clear()
+        s3_client._known_keys.clear()
+        await asyncio.gather(*(limited(doc) for doc in corpus))
+    wall = time.perf_counter() - wall_started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await close_clients()
+    await shutdown_parsers()
+    await bot.session.close()
+    await fakes.stop()
+
+    try:
+        import resource
+        max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        max_rss_mb = None
+
+    processed = args.iterations * len(corpus)
+    return {
+        "commit": _git_commit(),
+        "params": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "ocr_latency": args.ocr_latency,
+            "model": args.model,
+            "stream": args.stream,
+            "quota_rps": args.quota_rps,
+        },
+        "stages": {stage: _summary(values) for stage, values in sorted(samples.items())},
+        "throughput_docs_per_s": round(processed / wall, 2),
+        "peak_python_mem_mb": round(peak / 1024 / 1024, 1),
+        "max_rss_mb": max_rss_mb,
+        "requests": fakes.requests,
+        "ocr_payload": ocr_payload,
+    }
+
+
+def _print_report(report: dict, baseline: dict | None = None):
+    print(f"commit {report['commit']}  params {json.dumps(report['params'], ensure_ascii=False)}")
+    header = f"{'stage':<24}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}"
+    print(header)
+    for stage, s in report["stages"].items():
+        line = f"{stage:<24}{s['n']:>5}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        base = (baseline or {}).get("stages", {}).get(stage)
+        if base:
+            for key in ("p50_ms", "p95_ms"):
+                delta = (s[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+                line += f"{delta:>+8.1f}%"
+        print(line)
+    for name, p in report.get("ocr_payload", {}).items():
+        line = (f"ocr payload {name}: {p['bytes_in']} -> {p['bytes_out']} bytes, "
+                f"{p['requests']} requests, {p['dropped_pages']} duplicate pages dropped")
+        base = (baseline or {}).get("ocr_payload", {}).get(name)
+        if base and base["bytes_out"]:
+            line += f" ({(p['bytes_out'] - base['bytes_out']) / base['bytes_out'] * 100:+.1f}%)"
+        print(line)
+    if report["requests"].get("throttled"):
+        print(f"throttled by fake quotas: {report['requests']['throttled']} responses (429/SlowDown)")
+    print(f"throughput: {report['throughput_docs_per_s']} docs/s")
+    print(f"peak python memory: {report['peak_python_mem_mb']} MB, max RSS: {report['max_rss_mb']} MB")
+    if baseline:
+        print(f"baseline commit {baseline.get('commit')}: throughput {baseline.get('throughput_docs_per_s')} docs/s, "
+              f"peak python memory {baseline.get('peak_python_mem_mb')} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера map-бота на локальных заглушках")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="задержка ответа LLM-заглушки, с")
+    parser.add_argument("--ocr-latency", type=float, default=0.02, help="задержка ответа OCR-заглушки, с")
+    parser.add_argument("--model", default="YandexGPT 🇷🇺", help="кнопка модели из MODEL_MAPPING")
+    parser.add_argument("--stream", action="store_true", help="генерация в режиме стриминга")
+    parser.add_argument("--quota-rps", type=float, default=0,
+                        help="квота заглушек OCR/LLM/S3, запросов в секунду (сверх — 429); 0 — без квот")
+    parser.add_argument("--out", help="сохранить отчёт в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(_run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_report(report, baseline)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,148 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
-YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
-YANDEX_MODEL = os.getenv("YANDEX_MODEL", "general")
-YANDEX_OCR_URL = os.getenv("YANDEX_OCR_URL", "https://ocr.api.cloud.yandex.net/ocr/v1/recognizeText")
-YANDEX_URL = os.getenv('YANDEX_URL')
-YANDEX_API_URL = os.getenv(
-    "YANDEX_API_URL",
-    "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
-)
-YC_ACCESS_KEY_ID = os.getenv("YC_ACCESS_KEY_ID")
-YC_SECRET_ACCESS_KEY = os.getenv("YC_SECRET_ACCESS_KEY")
-YC_BUCKET_NAME = os.getenv("YC_BUCKET_NAME", "webapp-tgmini") 
-YC_S3_ENDPOINT = os.getenv("YC_S3_ENDPOINT", "https://storage.yandexcloud.net")
-YC_WEBSITE_HOST = os.getenv(
-    "YC_WEBSITE_HOST",
-    "webapp-tgmini.website.yandexcloud.net",  
-)
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-NETLIFY_URL = os.getenv("NETLIFY_URL")  
-GITHUB_REPO = os.getenv("GITHUB_REPO")  
-
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
-OPENROUTER_DEFAULT_MODEL = os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-4.1-mini")
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
+YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
+YANDEX_MODEL = os.getenv("YANDEX_MODEL", "general")
+YANDEX_OCR_URL = os.getenv("YANDEX_OCR_URL", "https://ocr.api.cloud.yandex.net/ocr/v1/recognizeText")
+YANDEX_URL = os.getenv('YANDEX_URL')
+YANDEX_API_URL = os.getenv(
+    "YANDEX_API_URL",
+    "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
+)
+YC_ACCESS_KEY_ID = os.getenv("YC_ACCESS_KEY_ID")
+YC_SECRET_ACCESS_KEY = os.getenv("YC_SECRET_ACCESS_KEY")
+YC_BUCKET_NAME = os.getenv("YC_BUCKET_NAME", "webapp-tgmini") 
+YC_S3_ENDPOINT = os.getenv("YC_S3_ENDPOINT", "https://storage.yandexcloud.net")
+YC_WEBSITE_HOST = os.getenv(
+    "YC_WEBSITE_HOST",
+    "webapp-tgmini.website.yandexcloud.net",  
+)
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+NETLIFY_URL = os.getenv("NETLIFY_URL")  
+GITHUB_REPO = os.getenv("GITHUB_REPO")  
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_API_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_DEFAULT_MODEL = os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-4.1-mini")
+
+# Пул HTTP-соединений к внешним API (LLM, OCR)
+HTTP_CONNECTION_LIMIT = int(os.getenv("HTTP_CONNECTION_LIMIT", "100"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+YANDEX_LLM_CONCURRENCY = int(os.getenv("YANDEX_LLM_CONCURRENCY", "10"))
+OPENROUTER_CONCURRENCY = int(os.getenv("OPENROUTER_CONCURRENCY", "20"))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "8"))
+# Сколько страниц скана отправлять в OCR одним запросом
+OCR_PAGES_PER_REQUEST = int(os.getenv("OCR_PAGES_PER_REQUEST", "1"))
+
+# Кэш извлечённого текста (по file_unique_id / sha256 файла)
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", ".cache/text")
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Кэш готовых карт generate_markmap (текст + глубина + модель + версия промпта)
+MARKMAP_CACHE_ENABLED = os.getenv("MARKMAP_CACHE_ENABLED", "1") == "1"
+MARKMAP_CACHE_DIR = os.getenv("MARKMAP_CACHE_DIR", ".cache/markmap")
+MARKMAP_CACHE_MAX_BYTES = int(os.getenv("MARKMAP_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+MARKMAP_CACHE_TTL = float(os.getenv("MARKMAP_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Стриминг ответа LLM с показом узлов карты в статус-сообщении
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+
+# Map-reduce для длинных документов: текст длиннее LLM_CHUNK_CHARS режется на куски
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", "12000"))
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+
+# Очередь генерации карт: всего воркеров и сколько задач одновременно у одного пользователя
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_PER_USER = int(os.getenv("JOB_PER_USER", "1"))
+# Как часто (не чаще раза в N секунд) обновлять у ждущей задачи сообщение с позицией в очереди
+JOB_POSITION_UPDATE_INTERVAL = float(os.getenv("JOB_POSITION_UPDATE_INTERVAL", "3"))
+
+# Пул процессов для парсеров PDF/DOCX/PPTX
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", str(os.cpu_count() or 2)))
+PARSER_TIMEOUT = float(os.getenv("PARSER_TIMEOUT", "30"))
+PARSER_MEMORY_LIMIT_MB = int(os.getenv("PARSER_MEMORY_LIMIT_MB", "1024"))
+
+# Сколько символов текста максимум достаём из документа (больше в LLM всё равно не уйдёт)
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "400000"))
+
+# SQLite-база с картами пользователей
+MAPS_DB_PATH = os.getenv("MAPS_DB_PATH", "data/maps.db")
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+# Общий S3-клиент: пул соединений, число одновременных загрузок, порог multipart
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "20"))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "10"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+
+# Формат карты для mini-app: "json" — готовое дерево markmap, "md" — Markdown (разбор в браузере)
+MAP_ARTIFACT_FORMAT = os.getenv("MAP_ARTIFACT_FORMAT", "json")
+
+# Метрики Prometheus на отдельном порту (/metrics); 0 — не поднимать сервер
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Режим получения апдейтов: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный HTTPS-адрес, на который Telegram шлёт апдейты (без пути), и путь вебхука
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Встроенный HTTP-сервер вебхука и число процессов-воркеров на одном порту
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+# Сколько секунд ждать воркеры после SIGTERM/SIGINT, прежде чем убить их
+WEBHOOK_STOP_TIMEOUT = float(os.getenv("WEBHOOK_STOP_TIMEOUT", "30"))
+
+# Хранилище состояний диалогов (FSM): "memory" — в процессе, "redis" — общее для всех реплик
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд брошенный диалог забывается (только для redis); 0 — не истекает
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 3600)))
+
+# Скачивание файлов из Telegram: лимит размера (Bot API отдаёт до 20 МБ),
+# сколько держим в памяти до переноса во временный файл, размер куска потока
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(20 * 1024 * 1024)))
+DOWNLOAD_SPOOL_BYTES = int(os.getenv("DOWNLOAD_SPOOL_BYTES", str(2 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+DOWNLOAD_SPOOL_DIR = os.getenv("DOWNLOAD_SPOOL_DIR") or None
+
+# Подготовка картинок к OCR: длинная сторона, качество JPEG и порог похожести страниц скана
+# (среднее отличие пикселей миниатюр, 0–255): не больше порога — страница считается дубликатом
+OCR_IMAGE_MAX_SIDE = int(os.getenv("OCR_IMAGE_MAX_SIDE", "2400"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "80"))
+OCR_DUPLICATE_DISTANCE = float(os.getenv("OCR_DUPLICATE_DISTANCE", "4"))
+
+# Hedging LLM-запросов: если модель не ответила за LLM_HEDGE_PERCENTILE-перцентиль
+# своих обычных задержек, параллельно спрашиваем следующую модель из LLM_HEDGE_MODELS
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_MODELS = [m.strip() for m in os.getenv("LLM_HEDGE_MODELS", "yandexgpt,openai/gpt-4o-mini").split(",") if m.strip()]
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))
+# Порог, пока статистики задержек ещё мало
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "20"))
+
+# Автомат по провайдерам LLM: сколько ошибок подряд размыкает его и на сколько секунд
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Лимиты скорости внешних API, запросов в секунду. Это стартовая и максимальная скорость:
+# после 429 она снижается и восстанавливается по мере успешных ответов, лишние запросы ждут в очереди
+YANDEX_LLM_RPS = float(os.getenv("YANDEX_LLM_RPS", "10"))
+OPENROUTER_RPS = float(os.getenv("OPENROUTER_RPS", "20"))
+OCR_RPS = float(os.getenv("OCR_RPS", "5"))
+S3_RPS = float(os.getenv("S3_RPS", "50"))
+# Сколько секунд запрос может простоять в очереди, прежде чем сдаться
+RATE_LIMIT_QUEUE_TIMEOUT = float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT", "120"))
+
+# Повторы при 5xx и обрывах соединения (общий таймаут запроса не повторяется; 429 ждёт квоту
+# в очереди и попыткой не считается): число попыток и границы экспоненциальной задержки
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
@@ -1,20 +1,36 @@
-from aiogram import Router
-from aiogram.types import Message
-
-from services.storage import get_user_maps
-from keyboards import history_keyboard
-
-router = Router()
-
-@router.message(lambda m: m.text == "📚 История")
-async def history_handler(message: Message):
-    maps = get_user_maps(message.from_user.id)
-
-    if not maps:
-        await message.answer("История пуста.")
-        return
-
-    await message.answer(
-        "📚 Твои карты:",
-        reply_markup=history_keyboard(maps)
-    )
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery
+
+from services.storage import get_user_maps_page
+from keyboards import history_keyboard
+
+router = Router()
+
+@router.message(lambda m: m.text == "📚 История")
+async def history_handler(message: Message):
+    page = get_user_maps_page(message.from_user.id)
+
+    if not page["maps"]:
+        await message.answer("История пуста.")
+        return
+
+    await message.answer(
+        "📚 Твои карты:",
+        reply_markup=history_keyboard(page["maps"], older=page["older"], newer=page["newer"])
+    )
+
+
+@router.callback_query(F.data.startswith("history:"))
+async def history_page_handler(callback: CallbackQuery):
+    # history:older:<created_at> / history:newer:<created_at>
+    _, direction, cursor = callback.data.split(":", 2)
+    if direction == "older":
+        page = get_user_maps_page(callback.from_user.id, before=int(cursor))
+    else:
+        page = get_user_maps_page(callback.from_user.id, after=int(cursor))
+
+    if page["maps"]:
+        await callback.message.edit_reply_markup(
+            reply_markup=history_keyboard(page["maps"], older=page["older"], newer=page["newer"])
+        )
+    await callback.answer()
@@ -1,98 +1,157 @@
-from aiogram import Router
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
-from aiogram.fsm.context import FSMContext
-from uuid import uuid4
-
-from states import CreateMap
-from services.llm import generate_markmap
-# from services.github_storage import upload_to_github 
-from keyboards import main_menu_keyboard
-from services.storage import save_map, upload_to_s3 
-from services.document_text import extract_text
-from config import YC_WEBSITE_HOST 
-
-router = Router()
-
-@router.message(CreateMap.waiting_for_llm)
-async def process_handler(message: Message, state: FSMContext):
-    selected_model = message.text
-    data = await state.get_data()
-    depth = data.get("depth", "Средняя")
-    source_message = data.get("source_message")
-
-    status_message = await message.answer("🧠 Анализирую документ...")
-
-    text = await extract_text(source_message)
-    try:
-        await status_message.edit_text("🗺 Формирую структуру...")
-    except Exception:
-        pass
-
-    # Генерация контента
-    result = generate_markmap(text=text, depth=depth, model_name=selected_model)
-
-    data = await state.get_data()
-    custom_title = data.get("user_title")
-    
-    # Если есть свое название - берем его, иначе - то, что выдал ИИ
-    final_title = custom_title if custom_title else result["title"]
-    
-    # Генерируем уникальное имя файла
-    filename = f"{uuid4()}.md"
-
-    try:
-        await status_message.edit_text("☁️ Сохраняю в S3...")
-        
-        # Получаем путь (например: generated_maps/uuid.md)
-        s3_path = upload_to_s3(result["markmap"], filename)
-        
-        # убираем http/https и лишние слэши
-        clean_host = YC_WEBSITE_HOST.replace("https://", "").replace("http://", "").strip("/")
-        
-        # если s3_path вдруг вернул полную ссылку, берем только хвост
-        if "file=" in s3_path:
-            s3_path = s3_path.split("file=")[-1]
-        elif "http" in s3_path:
-            s3_path = s3_path.split("/")[-1]
-            s3_path = f"generated_maps/{s3_path}"
-
-        app_url = f"https://{clean_host}/index.html?file={s3_path}"
-        
-    except Exception as e:
-        print(f"S3 Error: {e}")
-        await message.answer(f"❌ Ошибка S3: {e}")
-        await state.clear()
-        return
-  
-    save_map(
-        user_id=message.from_user.id,
-        title=final_title,
-        depth=depth,
-        structure=result["nodes"],
-        markmap=result["markmap"],
-        url=app_url, 
-    )
-
-    try:
-        await status_message.delete()
-    except Exception:
-        pass
-
-    # Кнопка для конкретной карты
-    inline_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🚀 Открыть карту", web_app=WebAppInfo(url=app_url))]
-    ])
-
-    await message.answer(
-        f"✅ <b>Карта готова: {final_title}</b>\n\n"
-        f"<code>{result['markmap']}</code>",
-        reply_markup=inline_kb,
-        parse_mode="HTML"
-    )
-
-    await state.clear()
-    # В главное меню
-    await message.answer(
-        "Возврат в меню:",
-        reply_markup=main_menu_keyboard(last_map_url=app_url)
-    )
+from aiogram import Router
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+from aiogram.fsm.context import FSMContext
+import time
+import logging
+
+from states import CreateMap
+from services.llm import generate_markmap, markmap_tree
+# from services.github_storage import upload_to_github 
+from keyboards import main_menu_keyboard
+from services.storage import save_map, upload_to_s3, upload_tree_to_s3
+from services.document_text import extract_text
+from services.progress import update_status
+from services.jobs import SCHEDULER, JobCancelled
+from services.metrics import log_event
+from config import YC_WEBSITE_HOST, LLM_STREAMING, MAP_ARTIFACT_FORMAT
+
+router = Router()
+
+@router.message(CreateMap.waiting_for_llm)
+async def process_handler(message: Message, state: FSMContext):
+    selected_model = message.text
+    # Параметры берём сразу: пока задача ждёт в очереди, пользователь может начать новый сценарий
+    data = await state.get_data()
+    await state.set_state(CreateMap.processing)
+
+    status_message = await message.answer("⏳ Ставлю в очередь...")
+
+    async def on_position(position):
+        await update_status(status_message, f"⏳ Ты в очереди: {position}")
+
+    # Генерация идёт через общий планировщик: ограниченное число воркеров,
+    # честная очередь между пользователями и отмена по /cancel
+    job = SCHEDULER.submit(
+        message.from_user.id,
+        lambda: _build_map(message, state, status_message, selected_model, data),
+        on_position=on_position,
+    )
+    try:
+        await job.wait()
+    except JobCancelled:
+        await update_status(status_message, "🚫 Генерация отменена.")
+    except Exception as e:
+        log_event("job_error", logging.ERROR, user_id=message.from_user.id, error=str(e))
+        await update_status(status_message, f"❌ Ошибка при создании карты: {e}")
+        await _finish_scenario(state)
+
+
+async def _finish_scenario(state: FSMContext):
+    # Пока задача ждала в очереди, пользователь мог начать новый сценарий — его не трогаем
+    if await state.get_state() == CreateMap.processing:
+        await state.clear()
+
+
+async def _build_map(
+    message: Message,
+    state: FSMContext,
+    status_message: Message,
+    selected_model: str,
+    data: dict,
+):
+    depth = data.get("depth", "Средняя")
+    source_file = data.get("source_file")
+
+    await update_status(status_message, "🧠 Анализирую документ...")
+
+    text = await extract_text(message.bot, source_file)
+    try:
+        await status_message.edit_text("🗺 Формирую структуру...")
+    except Exception:
+        pass
+
+    # Показываем узлы верхнего уровня по мере генерации.
+    # Telegram не любит частые edit_text, поэтому обновляем не чаще раза в секунду.
+    last_edit = 0.0
+
+    async def on_progress(titles):
+        nonlocal last_edit
+        now = time.monotonic()
+        if now - last_edit < 1.0:
+            return
+        last_edit = now
+        preview = "\n".join(f"• {t}" for t in titles)
+        await update_status(status_message, f"🗺 Формирую структуру...\n\n{preview}")
+
+    # Генерация контента
+    result = await generate_markmap(
+        text=text,
+        depth=depth,
+        model_name=selected_model,
+        on_progress=on_progress if LLM_STREAMING else None,
+    )
+
+    custom_title = data.get("user_title")
+    
+    # Если есть свое название - берем его, иначе - то, что выдал ИИ
+    final_title = custom_title if custom_title else result["title"]
+
+    try:
+        await status_message.edit_text("☁️ Сохраняю в S3...")
+        
+        # Получаем путь (например: generated_maps/<sha256>.json)
+        if MAP_ARTIFACT_FORMAT == "md":
+            s3_path = await upload_to_s3(result["markmap"])
+        else:
+            s3_path = await upload_tree_to_s3(markmap_tree(result["title"], result["nodes"]))
+        
+        # убираем http/https и лишние слэши
+        clean_host = YC_WEBSITE_HOST.replace("https://", "").replace("http://", "").strip("/")
+        
+        # если s3_path вдруг вернул полную ссылку, берем только хвост
+        if "file=" in s3_path:
+            s3_path = s3_path.split("file=")[-1]
+        elif "http" in s3_path:
+            s3_path = s3_path.split("/")[-1]
+            s3_path = f"generated_maps/{s3_path}"
+
+        app_url = f"https://{clean_host}/index.html?file={s3_path}"
+        
+    except Exception as e:
+        log_event("s3_error", logging.ERROR, user_id=message.from_user.id, error=str(e))
+        await message.answer(f"❌ Ошибка S3: {e}")
+        await _finish_scenario(state)
+        return
+  
+    save_map(
+        user_id=message.from_user.id,
+        title=final_title,
+        depth=depth,
+        structure=result["nodes"],
+        markmap=result["markmap"],
+        url=app_url, 
+    )
+
+    try:
+        await status_message.delete()
+    except Exception:
+        pass
+
+    # Кнопка для конкретной карты
+    inline_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🚀 Открыть карту", web_app=WebAppInfo(url=app_url))]
+    ])
+
+    await message.answer(
+        f"✅ <b>Карта готова: {final_title}</b>\n\n"
+        f"<code>{result['markmap']}</code>",
+        reply_markup=inline_kb,
+        parse_mode="HTML"
+    )
+
+    await _finish_scenario(state)
+    # В главное меню
+    await message.answer(
+        "Возврат в меню:",
+        reply_markup=main_menu_keyboard(last_map_url=app_url)
+    )
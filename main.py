@@ -1,21 +1,205 @@
-import asyncio
-from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
-from handlers import start, upload, settings, process, menu, history, cancel, view_map
-
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
-
-    dp.include_router(start.router)
-    dp.include_router(upload.router)
-    dp.include_router(settings.router)
-    dp.include_router(process.router)
-    dp.include_router(history.router)
-    dp.include_router(cancel.router)
-    dp.include_router(menu.router)
-    dp.include_router(view_map.router)
-    await dp.start_polling(bot)
-
-if __name__ == "__main__":
-    asyncio.run(main())
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import BOT_TOKEN, METRICS_HOST, METRICS_PORT, LOG_LEVEL
+from config import (
+    BOT_MODE,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_STOP_TIMEOUT,
+)
+from config import FSM_STORAGE, REDIS_URL, FSM_TTL
+from services.http_client import close_clients
+from services.parser_pool import shutdown_parsers
+from services.metrics import TelegramTimingMiddleware, start_metrics_server, log_event
+from services.jobs import start_cancel_broadcast
+from handlers import start, upload, settings, process, menu, history, cancel, view_map
+
+def _setup_logging():
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(process)d %(name)s %(message)s")
+
+def create_bot() -> Bot:
+    bot = Bot(token=BOT_TOKEN)
+    bot.session.middleware(TelegramTimingMiddleware())
+    return bot
+
+def create_storage() -> BaseStorage:
+    """
+    FSM-хранилище. В памяти процесса — для одной копии бота;
+    Redis (или совместимый сервер) — когда реплик несколько или состояние должно переживать перезапуск.
+    """
+    if FSM_STORAGE == "redis":
+        # redis — опциональная зависимость, нужна только в этом режиме
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL or None, data_ttl=FSM_TTL or None)
+    return MemoryStorage()
+
+def create_dispatcher() -> Dispatcher:
+    storage = create_storage()
+    dp = Dispatcher(storage=storage)
+
+    dp.include_router(start.router)
+    dp.include_router(upload.router)
+    dp.include_router(settings.router)
+    dp.include_router(process.router)
+    dp.include_router(history.router)
+    dp.include_router(cancel.router)
+    dp.include_router(menu.router)
+    dp.include_router(view_map.router)
+    dp.shutdown.register(close_clients)
+    dp.shutdown.register(shutdown_parsers)
+    dp.shutdown.register(storage.close)
+    return dp
+
+async def main():
+    _setup_logging()
+
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    try:
+        # Вебхук и polling взаимоисключающие: при переходе обратно на polling снимаем вебхук
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+# РЕЖИМ WEBHOOK
+
+async def set_webhook():
+    """Регистрирует вебхук в Telegram один раз — до запуска воркеров."""
+    bot = create_bot()
+    dp = create_dispatcher()
+    try:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    finally:
+        await dp.storage.close()
+        await bot.session.close()
+    log_event("webhook_set", url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH, workers=WEBHOOK_WORKERS)
+
+async def serve_webhook(worker_index: int = 0):
+    """
+    Один воркер: aiohttp-сервер, принимающий апдейты на WEBHOOK_PATH.
+    Ответ Telegram уходит сразу, а обработка апдейта продолжается в фоне
+    (handle_in_background), поэтому долгая генерация карты не держит запрос.
+    Несколько воркеров слушают один порт через SO_REUSEPORT — ядро раскидывает соединения между ними.
+    Очередь генерации у каждого воркера своя; /cancel рассылается всем воркерам через Redis.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    cancel_listener = None
+    if WEBHOOK_WORKERS > 1:
+        cancel_listener = start_cancel_broadcast(dp.storage.redis)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1).start()
+    log_event("webhook_worker_started", worker=worker_index, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+    metrics_runner = None
+    if METRICS_PORT:
+        # Метрики у каждого процесса свои — каждый воркер на своём порту
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + worker_index)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if cancel_listener is not None:
+            cancel_listener.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await runner.cleanup()
+
+def _webhook_worker(worker_index: int):
+    _setup_logging()
+    # SIGTERM (systemd, docker stop) — как Ctrl+C: asyncio.run отменит задачи,
+    # и serve_webhook закроет сервер и подписку в finally
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve_webhook(worker_index))
+    except KeyboardInterrupt:
+        pass
+
+def _webhook_child(worker_index: int):
+    # Ctrl+C в терминале получает вся группа процессов; воркер остановит родитель через SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _webhook_worker(worker_index)
+
+def _stop_workers(workers: list):
+    """SIGTERM всем воркерам, ожидание до WEBHOOK_STOP_TIMEOUT, затем kill оставшихся."""
+    for proc in workers:
+        if proc.is_alive():
+            proc.terminate()
+    deadline = time.monotonic() + WEBHOOK_STOP_TIMEOUT
+    for proc in workers:
+        proc.join(max(0.0, deadline - time.monotonic()))
+        if proc.is_alive():
+            log_event("webhook_worker_killed", logging.WARNING, worker=proc.name)
+            proc.kill()
+            proc.join()
+
+def run_webhook():
+    _setup_logging()
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL")
+    if WEBHOOK_WORKERS > 1 and FSM_STORAGE != "redis":
+        # Апдейты одного пользователя попадают в разные процессы: состояние в памяти терялось бы
+        raise RuntimeError("WEBHOOK_WORKERS > 1 требует общего хранилища состояний: FSM_STORAGE=redis")
+    asyncio.run(set_webhook())
+
+    if WEBHOOK_WORKERS <= 1:
+        _webhook_worker(0)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_webhook_child, args=(i,), name=f"webhook-{i}") for i in range(WEBHOOK_WORKERS)]
+
+    def on_signal(signum, frame):
+        # Повторный сигнал во время остановки не должен оборвать ожидание воркеров
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        log_event("webhook_stopping", signal=signal.Signals(signum).name)
+        _stop_workers(workers)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    for proc in workers:
+        proc.start()
+    for proc in workers:
+        proc.join()
+
+if __name__ == "__main__":
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(main())
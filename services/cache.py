@@ -0,0 +1,147 @@
+# services/cache.py
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Optional
+
+# Чужие записи (другие процессы) подхватываем пересканом каталога: перед вытеснением
+# и не реже раза в столько секунд — но не на каждой записи, это O(числа файлов)
+_RESCAN_INTERVAL = 60
+# Вытесняем с запасом, до такой доли max_bytes: иначе полный кэш
+# упирался бы в лимит (и пересканировался) на каждой записи
+_EVICT_TO_SHARE = 0.9
+
+
+class DiskCache:
+    """
+    Простой кэш на диске: один JSON-файл на ключ.
+    - max_bytes: суммарный размер файлов, сверх него выкидываем самые давно использованные (LRU);
+    - ttl: время жизни записи в секундах (None — без ограничения).
+
+    Каталог может делить несколько процессов (воркеры вебхука): время доступа хранится
+    в mtime файлов, а размер пересчитывается по каталогу перед вытеснением и раз
+    в _RESCAN_INTERVAL, поэтому max_bytes — общий лимит каталога, а не одного процесса
+    (превышение — не больше того, что другие процессы успели записать между пересканами).
+    Из async-кода вызывать aget/aset — файловый ввод-вывод уходит в поток.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # имя файла -> (размер, время последнего доступа)
+        self._index: Optional[dict] = None
+        self._total = 0
+        self._scanned_at = 0.0
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        return os.path.join(self.directory, name)
+
+    def _load_index(self, refresh: bool = False):
+        if self._index is not None and not refresh:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = {}
+        self._total = 0
+        self._scanned_at = time.monotonic()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue  # удалил другой процесс
+            self._index[entry.name] = (st.st_size, st.st_mtime)
+            self._total += st.st_size
+
+    def _forget(self, name: str):
+        size, _ = self._index.pop(name, (0, 0))
+        self._total -= size
+
+    def _drop(self, name: str):
+        self._forget(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str):
+        path = self._path(key)
+        name = os.path.basename(path)
+        with self._lock:
+            self._load_index()
+            # Индекс может не знать о записи другого процесса — проверяем сам файл
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                self._forget(name)
+                return None
+            except (OSError, ValueError):
+                self._drop(name)
+                return None
+
+            if self.ttl is not None and time.time() - record.get("created", 0) > self.ttl:
+                self._drop(name)
+                return None
+
+            # Обновляем время доступа для LRU
+            now = time.time()
+            if name not in self._index:
+                size = os.path.getsize(path)
+                self._total += size
+            else:
+                size, _ = self._index[name]
+            self._index[name] = (size, now)
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            return record.get("value")
+
+    def set(self, key: str, value):
+        path = self._path(key)
+        name = os.path.basename(path)
+        payload = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False)
+        data = payload.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._load_index()
+            self._forget(name)
+
+            # У каждого процесса свой временный файл — одновременная запись одного ключа не ломает запись
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._index[name] = (len(data), time.time())
+            self._total += len(data)
+
+            # Сверяемся с каталогом, куда пишут и другие процессы, только перед вытеснением
+            # и изредка — между пересканами хватает своего индекса
+            if self._total > self.max_bytes or time.monotonic() - self._scanned_at > _RESCAN_INTERVAL:
+                self._load_index(refresh=True)
+            self._evict()
+
+    async def aget(self, key: str):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        target = self.max_bytes * _EVICT_TO_SHARE
+        # Самые давно использованные — первыми
+        for name, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total <= target:
+                break
+            self._drop(name)
@@ -1,226 +1,665 @@
-# services/document_text.py
-import io
-import json
-import base64
-import mimetypes
-from pathlib import Path
-
-import requests
-from aiogram.types import Message
-
-from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_OCR_URL
-
-
-# ЗАГРУЗКА ФАЙЛА ИЗ TELEGRAM
-
-async def _download_file_bytes(message: Message) -> bytes:
-    """
-    Скачиваем файл/фото из Telegram и возвращаем raw bytes.
-    """
-    file_obj = None
-
-    if message.document:
-        file_obj = await message.bot.get_file(message.document.file_id)
-    elif message.photo:
-        # берем самое большое фото
-        file_obj = await message.bot.get_file(message.photo[-1].file_id)
-
-    if not file_obj:
-        return b""
-
-    file_bytes = await message.bot.download_file(
-        file_obj.file_path,
-        destination=io.BytesIO()
-    )
-    file_bytes.seek(0)
-    return file_bytes.read()
-
-
-# OCR ДЛЯ ИЗОБРАЖЕНИЙ / СКАНОВ
-
-def _call_ocr(image_bytes: bytes, mime_type: str = "JPEG") -> str:
-    """
-    Вызов Yandex OCR и получение текста (fullText + строки).
-    """
-    if not image_bytes:
-        return ""
-
-    content_b64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    data = {
-        "mimeType": mime_type,          # JPEG / PNG / PDF
-        "languageCodes": ["ru", "en"],  # можно ["*"] для автоопределения
-        "model": "page",
-        "content": content_b64,
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Api-Key {YANDEX_API_KEY}",
-        "x-folder-id": YANDEX_FOLDER_ID,
-        "x-data-logging-enabled": "true",
-    }
-
-    resp = requests.post(
-        url=YANDEX_OCR_URL,
-        headers=headers,
-        data=json.dumps(data),
-    )
-    print("OCR RESPONSE:", resp.status_code, resp.text)
-    resp.raise_for_status()
-    result = resp.json()
-
-    text_annotation = result.get("result", {}).get("textAnnotation", {})
-    full_text = text_annotation.get("fullText")
-    if full_text:
-        return full_text.strip()
-
-    lines = []
-    for block in text_annotation.get("blocks", []):
-        for line in block.get("lines", []):
-            txt = line.get("text", "").strip()
-            if txt:
-                lines.append(txt)
-
-    return "\n".join(lines)
-
-
-# ЛОКАЛЬНЫЙ ПАРСИНГ ТЕКСТОВЫХ ФАЙЛОВ
-
-def _extract_text_from_pdf(file_bytes: bytes) -> str:
-    """
-    Пробуем достать текст из PDF без OCR (если PDF текстовый).
-    """
-    from pypdf import PdfReader  # pip install pypdf
-
-    buf = io.BytesIO(file_bytes)
-    reader = PdfReader(buf)
-    pieces = []
-    for page in reader.pages:
-        txt = page.extract_text() or ""
-        if txt:
-            pieces.append(txt)
-    return "\n".join(pieces).strip()
-
-
-def _extract_text_from_docx(file_bytes: bytes) -> str:
-    """
-    DOCX: вытаскиваем текст абзацев.
-    """
-    from docx import Document  # pip install python-docx
-
-    buf = io.BytesIO(file_bytes)
-    doc = Document(buf)
-    paras = [p.text for p in doc.paragraphs if p.text.strip()]
-    return "\n".join(paras).strip()
-
-
-def _extract_text_from_pptx(file_bytes: bytes) -> str:
-    """
-    PPTX: собираем текст из всех слайдов.
-    """
-    from pptx import Presentation  # pip install python-pptx
-
-    buf = io.BytesIO(file_bytes)
-    prs = Presentation(buf)
-    lines = []
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                txt = shape.text.strip()
-                if txt:
-                    lines.append(txt)
-    return "\n".join(lines).strip()
-
-
-def _extract_text_from_txt(file_bytes: bytes) -> str:
-    """
-    Простой текстовый файл (txt, md, csv и т.п.).
-    """
-    try:
-        return file_bytes.decode("utf-8").strip()
-    except UnicodeDecodeError:
-        # запасной вариант
-        return file_bytes.decode("cp1251", errors="ignore").strip()
-
-
-def _guess_extension(filename: str | None) -> str:
-    if not filename:
-        return ""
-    return Path(filename).suffix.lower()  # ".pdf", ".docx" и т.п.
-
-
-# ОСНОВНАЯ ФУНКЦИЯ ДЛЯ БОТА
-
-async def extract_text(message: Message) -> str:
-    """
-    Универсальная функция:
-    - если фото → OCR
-    - если документ → в зависимости от расширения:
-        * .txt/.md/.csv/... → читаем как текст
-        * .pdf → сначала пытаемся вытащить текст, если пусто — OCR
-        * .docx → python-docx
-        * .pptx → python-pptx
-      если формат неизвестен → пробуем как текст, если не вышло — OCR как изображение/PDF
-    """
-    # 1. Фото → сразу OCR
-    if message.photo:
-        image_bytes = await _download_file_bytes(message)
-        text = _call_ocr(image_bytes, mime_type="JPEG")
-        return text or "Фотография с текстом, но OCR не вернул результат."
-
-    # 2. Документ
-    if message.document:
-        file_bytes = await _download_file_bytes(message)
-        filename = message.document.file_name or ""
-        ext = _guess_extension(filename)
-
-        # Простые текстовые форматы
-        if ext in {".txt", ".md", ".csv", ".log"}:
-            text = _extract_text_from_txt(file_bytes)
-            return text or f"Документ {filename}, но текст не удалось прочитать."
-
-        # DOCX
-        if ext == ".docx":
-            try:
-                text = _extract_text_from_docx(file_bytes)
-                if text:
-                    return text
-            except Exception as e:
-                print("DOCX parse error:", e)
-
-        # PPTX
-        if ext == ".pptx":
-            try:
-                text = _extract_text_from_pptx(file_bytes)
-                if text:
-                    return text
-            except Exception as e:
-                print("PPTX parse error:", e)
-
-        # PDF: сначала «текстовый» парсинг, потом OCR
-        if ext == ".pdf":
-            try:
-                text = _extract_text_from_pdf(file_bytes)
-                if text:
-                    return text
-            except Exception as e:
-                print("PDF parse error:", e)
-
-            # если парсинг не дал результата — пробуем OCR по PDF
-            ocr_text = _call_ocr(file_bytes, mime_type="PDF")
-            return ocr_text or f"PDF {filename}, но ни текст, ни OCR не дали результата."
-
-        # Неизвестный формат:
-        # 1) пробуем прочитать как текст
-        text = _extract_text_from_txt(file_bytes)
-        if text:
-            return text
-
-        # 2) fallback — OCR как изображение (на случай сканов в непонятных форматах)
-        ocr_text = _call_ocr(file_bytes, mime_type="JPEG")
-        return ocr_text or f"Документ: {filename}, но формат не распознан."
-
-    # 3. Ничего не передали
-    return "Неизвестный документ"
-
+# services/document_text.py
+import io
+import json
+import base64
+import hashlib
+import time
+import asyncio
+import logging
+import mimetypes
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from config import (
+    YANDEX_API_KEY,
+    YANDEX_FOLDER_ID,
+    YANDEX_OCR_URL,
+    OCR_PAGES_PER_REQUEST,
+    OCR_IMAGE_MAX_SIDE,
+    OCR_JPEG_QUALITY,
+    OCR_DUPLICATE_DISTANCE,
+    EXTRACT_MAX_CHARS,
+    TEXT_CACHE_DIR,
+    TEXT_CACHE_MAX_BYTES,
+)
+from services.cache import DiskCache
+from services.downloads import DownloadedFile, check_file_size, download_file
+from services.http_client import get_client
+from services.metrics import (
+    CACHE_HITS,
+    CACHE_MISSES,
+    DOWNLOAD_SECONDS,
+    EXTRACT_SECONDS,
+    OCR_SECONDS,
+    log_event,
+)
+from services.parser_pool import run_parser
+from services.text_normalize import strip_page_boilerplate
+
+
+# ОПИСАНИЕ ФАЙЛА ДЛЯ FSM
+
+def file_info_from_message(message: Message) -> dict | None:
+    """
+    Сериализуемое описание присланного файла/фото — только то, что нужно, чтобы
+    потом скачать и разобрать файл. Хранится в FSM вместо самого Message,
+    поэтому переживает перезапуск и читается любой репликой бота.
+    """
+    if message.document:
+        doc = message.document
+        return {
+            "kind": "document",
+            "file_id": doc.file_id,
+            "file_unique_id": doc.file_unique_id,
+            "file_name": doc.file_name,
+            "file_size": doc.file_size,
+            "mime_type": doc.mime_type,
+        }
+    if message.photo:
+        # берем самое большое фото
+        photo = message.photo[-1]
+        return {
+            "kind": "photo",
+            "file_id": photo.file_id,
+            "file_unique_id": photo.file_unique_id,
+            "file_name": None,
+            "file_size": photo.file_size,
+            "mime_type": "image/jpeg",
+        }
+    return None
+
+
+# OCR ДЛЯ ИЗОБРАЖЕНИЙ / СКАНОВ
+
+# Кусок исходного файла, кодируемый в base64 за раз. Кратен 3 — тогда base64 кусков
+# склеивается в корректный base64 всего файла без «хвостов» и паддинга в середине.
+_OCR_READ_CHUNK = 3 * 16 * 1024
+
+
+def _open_source(source: bytes | DownloadedFile):
+    return io.BytesIO(source) if isinstance(source, bytes) else source.open()
+
+
+def _source_size(source: bytes | DownloadedFile) -> int:
+    return len(source) if isinstance(source, bytes) else source.size
+
+
+def _ocr_body_prefix(mime_type: str) -> bytes:
+    head = json.dumps({
+        "mimeType": mime_type,          # JPEG / PNG / PDF
+        "languageCodes": ["ru", "en"],  # можно ["*"] для автоопределения
+        "model": "page",
+    })
+    return (head[:-1] + ', "content": "').encode("utf-8")
+
+
+_OCR_BODY_SUFFIX = b'"}'
+
+
+async def _stream_ocr_body(source: bytes | DownloadedFile, mime_type: str):
+    """
+    JSON-тело запроса OCR, которое собирается по ходу отправки:
+    файл читается кусками по _OCR_READ_CHUNK байт и сразу кодируется в base64.
+    В памяти одновременно — один кусок и его base64, а не весь файл несколько раз.
+    """
+    yield _ocr_body_prefix(mime_type)
+    with _open_source(source) as f:
+        while True:
+            chunk = f.read(_OCR_READ_CHUNK)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+    yield _OCR_BODY_SUFFIX
+
+
+def _ocr_body_length(source: bytes | DownloadedFile, mime_type: str) -> int:
+    # Длина известна заранее — отправляем с Content-Length, а не chunked
+    size = _source_size(source)
+    return len(_ocr_body_prefix(mime_type)) + 4 * ((size + 2) // 3) + len(_OCR_BODY_SUFFIX)
+
+
+async def _call_ocr(source: bytes | DownloadedFile, mime_type: str = "JPEG") -> str:
+    """
+    Вызов Yandex OCR и получение текста (fullText + строки).
+    source — bytes (кусок PDF) или скачанный файл; тело запроса кодируется потоково.
+    """
+    if not _source_size(source):
+        return ""
+
+    headers = {
+        "Content-Type": "application/json",
+        "Content-Length": str(_ocr_body_length(source, mime_type)),
+        "Authorization": f"Api-Key {YANDEX_API_KEY}",
+        "x-folder-id": YANDEX_FOLDER_ID,
+        "x-data-logging-enabled": "true",
+    }
+
+    with OCR_SECONDS.time(mime=mime_type):
+        result = await get_client("ocr").post_json(YANDEX_OCR_URL, headers, lambda: _stream_ocr_body(source, mime_type))
+
+    text_annotation = result.get("result", {}).get("textAnnotation", {})
+    full_text = text_annotation.get("fullText")
+    if full_text:
+        return full_text.strip()
+
+    lines = []
+    for block in text_annotation.get("blocks", []):
+        for line in block.get("lines", []):
+            txt = line.get("text", "").strip()
+            if txt:
+                lines.append(txt)
+
+    return "\n".join(lines)
+
+
+# ПОДГОТОВКА ИЗОБРАЖЕНИЙ К OCR
+#
+# Фото с телефона (12+ Мп, цвет, JPEG высокого качества) OCR не нужно:
+# уменьшаем до OCR_IMAGE_MAX_SIDE по длинной стороне, переводим в оттенки серого
+# и пережимаем в JPEG с OCR_JPEG_QUALITY. Тело запроса и время распознавания
+# падают в разы, качество распознавания текста — нет.
+# Функции синхронные и тяжёлые по CPU — вызываются через run_parser.
+
+def _prepare_image(img, max_side: int = OCR_IMAGE_MAX_SIDE):
+    """PIL.Image → уменьшенное изображение в оттенках серого (режим "L")."""
+    from PIL import Image, ImageOps
+
+    scale = max_side / max(img.size)
+    if scale < 1:
+        # Для JPEG декодируем сразу в уменьшенном масштабе и в сером — это в разы быстрее
+        img.draft("L", (int(img.width * scale), int(img.height * scale)))
+    img = ImageOps.exif_transpose(img)
+    img = img.convert("L")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+
+def _encode_jpeg(img, quality: int = OCR_JPEG_QUALITY) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _preprocess_image(source: bytes | str) -> bytes:
+    """Фото/картинка (bytes или путь) → JPEG, готовый для OCR."""
+    from PIL import Image
+
+    with Image.open(_as_stream(source)) as img:
+        return _encode_jpeg(_prepare_image(img))
+
+
+def _page_thumbnail(img):
+    """
+    «Отпечаток» страницы: серая миниатюра 32x40 с растянутым контрастом.
+    Текст на ней сливается в пятна, поэтому пережатие, шум и сдвиг яркости
+    почти не меняют миниатюру, а другая страница даёт заметно другую картину.
+    """
+    from PIL import Image, ImageOps
+
+    return ImageOps.autocontrast(img.convert("L").resize((32, 40), Image.BOX))
+
+
+def _is_near_duplicate(thumbnail, seen: list) -> bool:
+    """Среднее отличие пикселей миниатюр (0–255) не больше OCR_DUPLICATE_DISTANCE."""
+    from PIL import ImageChops, ImageStat
+
+    return any(
+        ImageStat.Stat(ImageChops.difference(thumbnail, other)).mean[0] <= OCR_DUPLICATE_DISTANCE
+        for other in seen
+    )
+
+
+# Страница — скан, только если картинка закрывает почти весь лист. Одна картинка
+# (логотип, фото) рядом с текстом, нарисованным кривыми, — не скан: такая страница
+# уходит в OCR целиком, PDF-куском, иначе её текст потеряется.
+_SCAN_MIN_COVERAGE = 0.8
+
+
+def _image_coverage(page) -> float:
+    """
+    Доля площади MediaBox, которую занимают изображения, нарисованные прямо в потоке
+    команд страницы: площадь единичного квадрата после матрицы cm в момент Do.
+    Картинки внутри форм (Form XObject) не считаются — страница тогда не скан.
+    """
+    from pypdf.generic import ContentStream
+
+    contents = page.get_contents()
+    if contents is None:
+        return 0.0
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    ctm = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    saved = []
+    area = 0.0
+    for operands, operator in ContentStream(contents, page.pdf).operations:
+        if operator == b"q":
+            saved.append(ctm)
+        elif operator == b"Q":
+            ctm = saved.pop() if saved else ctm
+        elif operator == b"cm":
+            a, b, c, d, e, f = (float(x) for x in operands)
+            ta, tb, tc, td, te, tf = ctm
+            ctm = (
+                a * ta + b * tc, a * tb + b * td,
+                c * ta + d * tc, c * tb + d * td,
+                e * ta + f * tc + te, e * tb + f * td + tf,
+            )
+        elif operator == b"Do":
+            xobject = xobjects.get(operands[0])
+            if xobject is not None and xobject.get_object().get("/Subtype") == "/Image":
+                area += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height))
+    return min(1.0, area / page_area) if page_area else 0.0
+
+
+def _page_scan_image(page):
+    """
+    Картинка страницы-скана: ровно одно изображение на странице, закрывающее
+    не меньше _SCAN_MIN_COVERAGE листа. Иначе None.
+    """
+    try:
+        images = page.images
+        if len(images) != 1 or _image_coverage(page) < _SCAN_MIN_COVERAGE:
+            return None
+        return images[0].image
+    except Exception:
+        return None
+
+
+def _page_digest(page) -> str | None:
+    """
+    Точный отпечаток страницы без картинки-скана: поток команд + данные всех изображений.
+    Если данные изображений не читаются (JBIG2, CCITT и т.п.) — None: такую страницу
+    не с чем надёжно сравнить, и она не отбрасывается как дубликат.
+    """
+    digest = hashlib.sha256()
+    try:
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        for image in page.images:
+            digest.update(image.data)
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+def _prepare_pdf_for_ocr(source: bytes | str, pages_per_chunk: int = OCR_PAGES_PER_REQUEST) -> tuple[list, int]:
+    """
+    Готовит скан PDF к OCR: возвращает список кусков (mimeType, тело) в порядке страниц
+    и число выброшенных страниц-дубликатов.
+
+    - Страница-скан (одна картинка почти на весь лист) → картинка уменьшается и пережимается как фото,
+      уходит в OCR отдельным JPEG; почти одинаковые страницы (по миниатюре) отбрасываются.
+    - Остальные страницы режутся на PDF-куски по pages_per_chunk страниц,
+      точные повторы (тот же поток команд и те же изображения) отбрасываются;
+      страницы с нечитаемыми изображениями не сравниваются и идут в OCR всегда.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(_as_stream(source))
+    step = max(1, pages_per_chunk)
+    pieces = []
+    pending = []
+    seen_thumbnails = []
+    seen_digests = set()
+    dropped = 0
+
+    def flush():
+        if not pending:
+            return
+        writer = PdfWriter()
+        for pending_page in pending:
+            writer.add_page(pending_page)
+        buf = io.BytesIO()
+        writer.write(buf)
+        pieces.append(("PDF", buf.getvalue()))
+        pending.clear()
+
+    for page in reader.pages:
+        image = _page_scan_image(page)
+        if image is not None:
+            img = _prepare_image(image)
+            thumbnail = _page_thumbnail(img)
+            if _is_near_duplicate(thumbnail, seen_thumbnails):
+                dropped += 1
+                continue
+            seen_thumbnails.append(thumbnail)
+            flush()
+            pieces.append(("JPEG", _encode_jpeg(img)))
+            continue
+
+        digest = _page_digest(page)
+        if digest is not None:
+            if digest in seen_digests:
+                dropped += 1
+                continue
+            seen_digests.add(digest)
+        pending.append(page)
+        if len(pending) >= step:
+            flush()
+    flush()
+    return pieces, dropped
+
+
+async def _prepare_photo(downloaded: DownloadedFile) -> bytes | DownloadedFile:
+    """
+    Фото → уменьшенный серый JPEG. Если подготовка не удалась
+    или не уменьшила файл — отправляем оригинал.
+    """
+    try:
+        prepared = await run_parser(_preprocess_image, downloaded.source)
+    except Exception as e:
+        log_event("image_preprocess_error", logging.WARNING, error=str(e))
+        return downloaded
+    if len(prepared) >= downloaded.size:
+        return downloaded
+    log_event("image_preprocessed", bytes=downloaded.size, prepared_bytes=len(prepared))
+    return prepared
+
+
+async def _call_ocr_pdf(downloaded: DownloadedFile) -> tuple[str, bool]:
+    """
+    OCR скана PDF по страницам: куски распознаются параллельно
+    (число одновременных запросов ограничено клиентом "ocr"),
+    текст собирается в исходном порядке страниц.
+    Упавшая страница не ломает весь документ — её просто пропускаем.
+    Возвращает (текст, полный ли он): неполный текст нельзя класть в кэш.
+    """
+    try:
+        pieces, dropped = await run_parser(_prepare_pdf_for_ocr, downloaded.source, OCR_PAGES_PER_REQUEST)
+    except Exception as e:
+        log_event("pdf_split_error", logging.WARNING, error=str(e))
+        return await _call_ocr(downloaded, mime_type="PDF"), True
+
+    if dropped:
+        log_event("ocr_duplicates_dropped", pages=dropped, requests=len(pieces))
+
+    results = await asyncio.gather(
+        *(_call_ocr(body, mime_type=mime) for mime, body in pieces),
+        return_exceptions=True,
+    )
+
+    texts = []
+    complete = True
+    for idx, res in enumerate(results):
+        if isinstance(res, Exception):
+            log_event("ocr_chunk_error", logging.WARNING, chunk=idx, of=len(pieces), error=str(res))
+            complete = False
+            continue
+        if res:
+            texts.append(res)
+    return "\n".join(strip_page_boilerplate(texts)).strip(), complete
+
+
+# ЛОКАЛЬНЫЙ ПАРСИНГ ТЕКСТОВЫХ ФАЙЛОВ
+#
+# Извлечение ленивое: генераторы отдают текст по странице/абзацу/слайду,
+# а _join_with_budget перестаёт их читать, как только набрано max_chars символов.
+# Всё, что сверх бюджета, в LLM всё равно не попадёт — незачем это парсить.
+#
+# source — bytes (маленький файл в памяти) или путь к временному файлу
+# (см. services/downloads.py): большие файлы парсеры читают прямо с диска.
+
+def _as_stream(source: bytes | str):
+    """pypdf, python-docx и python-pptx принимают и путь, и файловый объект."""
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def _join_with_budget(pieces, max_chars: int) -> str:
+    out = []
+    total = 0
+    for piece in pieces:
+        piece = piece.strip()
+        if not piece:
+            continue
+        remaining = max_chars - total
+        if remaining <= 0:
+            break
+        if len(piece) > remaining:
+            out.append(piece[:remaining])
+            break
+        out.append(piece)
+        total += len(piece) + 1
+    return "\n".join(out).strip()
+
+
+def _iter_pdf_pages(source: bytes | str):
+    from pypdf import PdfReader  # pip install pypdf
+
+    reader = PdfReader(_as_stream(source))
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _iter_docx_paragraphs(source: bytes | str):
+    from docx import Document  # pip install python-docx
+
+    doc = Document(_as_stream(source))
+    for p in doc.paragraphs:
+        yield p.text
+
+
+def _iter_pptx_slides(source: bytes | str):
+    from pptx import Presentation  # pip install python-pptx
+
+    prs = Presentation(_as_stream(source))
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                yield shape.text
+
+
+def _extract_text_from_pdf(source: bytes | str, max_chars: int = EXTRACT_MAX_CHARS) -> str:
+    """
+    Пробуем достать текст из PDF без OCR (если PDF текстовый).
+    """
+    return _join_with_budget(strip_page_boilerplate(_iter_pdf_pages(source)), max_chars)
+
+
+def _extract_text_from_docx(source: bytes | str, max_chars: int = EXTRACT_MAX_CHARS) -> str:
+    """
+    DOCX: вытаскиваем текст абзацев.
+    """
+    return _join_with_budget(_iter_docx_paragraphs(source), max_chars)
+
+
+def _extract_text_from_pptx(source: bytes | str, max_chars: int = EXTRACT_MAX_CHARS) -> str:
+    """
+    PPTX: собираем текст из всех слайдов.
+    """
+    return _join_with_budget(_iter_pptx_slides(source), max_chars)
+
+
+def _detect_encoding(sample: bytes) -> str:
+    """utf-8, если образец начала файла декодируется (обрезанный в конце символ не в счёт), иначе cp1251."""
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            return "cp1251"
+    return "utf-8"
+
+
+def _extract_text_from_txt(downloaded: DownloadedFile, max_chars: int = EXTRACT_MAX_CHARS) -> str:
+    """
+    Простой текстовый файл (txt, md, csv и т.п.).
+    Большие файлы (логи, выгрузки CSV) не читаем целиком:
+    берём начало и конец по max_chars / 2 байт, обрезая по границе строки.
+    """
+    with downloaded.open() as f:
+        encoding = _detect_encoding(f.read(64 * 1024))
+        f.seek(0)
+
+        # В utf-8/cp1251 символов не больше, чем байт — такой файл влезает в бюджет целиком
+        if downloaded.size <= max_chars:
+            return f.read().decode(encoding, errors="ignore").strip()
+
+        half = max_chars // 2
+        head = f.read(half).decode(encoding, errors="ignore")
+        f.seek(-half, io.SEEK_END)
+        tail = f.read(half).decode(encoding, errors="ignore")
+    head = head[:head.rfind("\n")] if "\n" in head else head
+    tail = tail[tail.find("\n") + 1:] if "\n" in tail else tail
+    return f"{head.strip()}\n...\n{tail.strip()}"
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def _guess_extension(filename: str | None) -> str:
+    if not filename:
+        return ""
+    return Path(filename).suffix.lower()  # ".pdf", ".docx" и т.п.
+
+
+# КЭШ ИЗВЛЕЧЁННОГО ТЕКСТА
+
+TEXT_CACHE = DiskCache(TEXT_CACHE_DIR, max_bytes=TEXT_CACHE_MAX_BYTES)
+
+
+def _empty_text_message(file_info: dict) -> str:
+    """Что вернуть, если из файла не удалось достать текст."""
+    if file_info["kind"] == "photo":
+        return "Фотография с текстом, но OCR не вернул результат."
+
+    filename = file_info.get("file_name") or ""
+    ext = _guess_extension(filename)
+    if ext in {".txt", ".md", ".csv", ".log"}:
+        return f"Документ {filename}, но текст не удалось прочитать."
+    if ext == ".pdf":
+        return f"PDF {filename}, но ни текст, ни OCR не дали результата."
+    return f"Документ: {filename}, но формат не распознан."
+
+
+async def _extract_text_from_file(file_info: dict, downloaded: DownloadedFile) -> tuple[str, bool]:
+    """
+    Достаём текст из уже скачанного файла/фото.
+    Возвращает (текст, полный ли он). Пустая строка — текст получить не удалось;
+    неполный текст (часть страниц скана не распознана) в кэш не кладётся.
+    """
+    filename = file_info.get("file_name") or ""
+    ext = _guess_extension(filename)
+
+    # 1. Фото (и картинки, присланные файлом) → подготовка и OCR
+    if file_info["kind"] == "photo" or ext in IMAGE_EXTENSIONS:
+        return await _call_ocr(await _prepare_photo(downloaded), mime_type="JPEG"), True
+
+    # Простые текстовые форматы
+    if ext in {".txt", ".md", ".csv", ".log"}:
+        return _extract_text_from_txt(downloaded), True
+
+    # DOCX
+    if ext == ".docx":
+        try:
+            text = await run_parser(_extract_text_from_docx, downloaded.source)
+            if text:
+                return text, True
+        except Exception as e:
+            log_event("parse_error", logging.WARNING, format="docx", error=str(e))
+
+    # PPTX
+    if ext == ".pptx":
+        try:
+            text = await run_parser(_extract_text_from_pptx, downloaded.source)
+            if text:
+                return text, True
+        except Exception as e:
+            log_event("parse_error", logging.WARNING, format="pptx", error=str(e))
+
+    # PDF: сначала «текстовый» парсинг, потом OCR
+    if ext == ".pdf":
+        try:
+            text = await run_parser(_extract_text_from_pdf, downloaded.source)
+            if text:
+                return text, True
+        except Exception as e:
+            log_event("parse_error", logging.WARNING, format="pdf", error=str(e))
+
+        # если парсинг не дал результата — OCR по страницам
+        return await _call_ocr_pdf(downloaded)
+
+    # Неизвестный формат:
+    # 1) пробуем прочитать как текст
+    text = _extract_text_from_txt(downloaded)
+    if text:
+        return text, True
+
+    # 2) fallback — OCR как изображение (на случай сканов в непонятных форматах)
+    return await _call_ocr(downloaded, mime_type="JPEG"), True
+
+
+# ОСНОВНАЯ ФУНКЦИЯ ДЛЯ БОТА
+
+async def extract_text(bot: Bot, file_info: dict | None) -> str:
+    """
+    Универсальная функция:
+    - если фото → OCR
+    - если документ → в зависимости от расширения:
+        * .txt/.md/.csv/... → читаем как текст
+        * .pdf → сначала пытаемся вытащить текст, если пусто — OCR
+        * .docx → python-docx
+        * .pptx → python-pptx
+      если формат неизвестен → пробуем как текст, если не вышло — OCR как изображение/PDF
+
+    file_info — описание файла из file_info_from_message.
+    Результат кэшируется на диске по file_unique_id и по sha256 содержимого:
+    повторно присланный файл не скачивается и не распознаётся заново
+    (file_unique_id одинаков для одного файла у всех пользователей).
+    """
+    if not file_info:
+        # Ничего не передали
+        return "Неизвестный документ"
+
+    unique_id = file_info.get("file_unique_id")
+    if unique_id:
+        cached = await TEXT_CACHE.aget(f"tg:{unique_id}")
+        if cached:
+            CACHE_HITS.inc(cache="text")
+            return cached
+
+    # Слишком большой файл отбрасываем ещё до скачивания
+    check_file_size(file_info)
+    with DOWNLOAD_SECONDS.time():
+        downloaded = await download_file(bot, file_info["file_id"], file_info.get("file_size"))
+
+    with downloaded:
+        digest = downloaded.digest
+        cached = await TEXT_CACHE.aget(f"sha:{digest}")
+        if cached:
+            CACHE_HITS.inc(cache="text")
+            if unique_id:
+                await TEXT_CACHE.aset(f"tg:{unique_id}", cached)
+            return cached
+        CACHE_MISSES.inc(cache="text")
+
+        fmt = "photo" if file_info["kind"] == "photo" else (_guess_extension(file_info.get("file_name")) or "unknown").lstrip(".")
+        started = time.perf_counter()
+        with EXTRACT_SECONDS.time(format=fmt):
+            text, complete = await _extract_text_from_file(file_info, downloaded)
+        log_event(
+            "text_extracted",
+            format=fmt,
+            bytes=downloaded.size,
+            on_disk=not downloaded.in_memory,
+            chars=len(text),
+            complete=complete,
+            seconds=round(time.perf_counter() - started, 3),
+        )
+    if not text:
+        return _empty_text_message(file_info)
+
+    if not complete:
+        # Часть страниц не распознана (сбой OCR) — следующая попытка может дать полный текст
+        return text
+
+    await TEXT_CACHE.aset(f"sha:{digest}", text)
+    if unique_id:
+        await TEXT_CACHE.aset(f"tg:{unique_id}", text)
+    return text
@@ -0,0 +1,153 @@
+# services/downloads.py
+"""
+Потоковое скачивание файлов из Telegram.
+
+Файл приходит кусками и складывается в DownloadedFile: пока он маленький —
+в памяти, после DOWNLOAD_SPOOL_BYTES — во временный файл на диске.
+sha256 считается по ходу скачивания, а слишком большие файлы отбрасываются
+ещё до запроса (по file_size) или сразу, как только поток превысит лимит.
+"""
+import io
+import os
+import hashlib
+import tempfile
+
+from aiogram import Bot
+
+from config import MAX_FILE_SIZE, DOWNLOAD_SPOOL_BYTES, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SPOOL_DIR
+
+
+class FileTooLarge(Exception):
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        super().__init__(
+            f"Файл слишком большой: {size / 1024 / 1024:.1f} МБ, максимум {limit / 1024 / 1024:.0f} МБ"
+        )
+
+
+class DownloadedFile:
+    """
+    Буфер для скачанного файла. Пишется как BinaryIO (так его заполняет Bot.download_file),
+    читается через source — bytes для маленьких файлов или путь к временному файлу для больших.
+    Путь можно отдавать парсерам в другом процессе: так файл не копируется через pickle.
+    """
+
+    def __init__(self, limit: int = MAX_FILE_SIZE, spool_bytes: int = DOWNLOAD_SPOOL_BYTES):
+        self.limit = limit
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._data = None
+        self._sha = hashlib.sha256()
+
+    # --- запись (вызывает Bot.download_file) ---
+
+    def write(self, chunk: bytes) -> int:
+        self.size += len(chunk)
+        if self.limit and self.size > self.limit:
+            raise FileTooLarge(self.size, self.limit)
+        self._sha.update(chunk)
+        if self._file is None and self.size > self.spool_bytes:
+            self._rollover()
+        if self._file is not None:
+            return self._file.write(chunk)
+        return self._buffer.write(chunk)
+
+    def _rollover(self):
+        fd, self.path = tempfile.mkstemp(prefix="tg-", dir=DOWNLOAD_SPOOL_DIR)
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def seek(self, offset: int, whence: int = 0):
+        # Bot.download_file перематывает буфер в конце; читаем мы через source
+        return 0
+
+    def finish(self):
+        """Закрывает запись: маленький файл превращается в bytes, большой остаётся на диске."""
+        if self._file is not None:
+            self._file.close()
+        elif self._buffer is not None:
+            self._data = self._buffer.getvalue()
+            self._buffer = None
+
+    # --- чтение ---
+
+    @property
+    def digest(self) -> str:
+        return self._sha.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    @property
+    def source(self) -> bytes | str:
+        return self._data if self.path is None else self.path
+
+    def open(self):
+        """Файловый объект для чтения — без копирования содержимого в память."""
+        if self.path is None:
+            return io.BytesIO(self._data or b"")
+        return open(self.path, "rb")
+
+    def read_bytes(self) -> bytes:
+        if self.path is None:
+            return self._data or b""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_file_size(file_info: dict, limit: int = MAX_FILE_SIZE):
+    """Бросает FileTooLarge, если Telegram заранее сообщил размер больше лимита."""
+    size = file_info.get("file_size")
+    if limit and size and size > limit:
+        raise FileTooLarge(size, limit)
+
+
+async def download_file(bot: Bot, file_id: str, file_size: int | None = None, limit: int = MAX_FILE_SIZE) -> DownloadedFile:
+    """
+    Скачивает файл по file_id потоково, кусками по DOWNLOAD_CHUNK_SIZE.
+    Вызывающий отвечает за close() (или with) — он удаляет временный файл.
+    """
+    check_file_size({"file_size": file_size}, limit)
+    file_obj = await bot.get_file(file_id)
+    check_file_size({"file_size": file_obj.file_size}, limit)
+
+    downloaded = DownloadedFile(limit=limit)
+    try:
+        await bot.download_file(
+            file_obj.file_path,
+            destination=downloaded,
+            chunk_size=DOWNLOAD_CHUNK_SIZE,
+            seek=False,
+        )
+        downloaded.finish()
+    except BaseException:
+        downloaded.close()
+        raise
+    return downloaded
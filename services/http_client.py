@@ -0,0 +1,158 @@
+# services/http_client.py
+import asyncio
+import logging
+from typing import AsyncIterable, Callable, Dict, Optional, Union
+
+import aiohttp
+
+from config import (
+    HTTP_CONNECTION_LIMIT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    LLM_REQUEST_TIMEOUT,
+    YANDEX_LLM_CONCURRENCY,
+    OPENROUTER_CONCURRENCY,
+    OCR_CONCURRENCY,
+)
+from services.metrics import log_event
+from services.rate_limit import call_with_retries, parse_retry_after
+
+
+# Сколько одновременных запросов разрешено каждому провайдеру
+PROVIDER_CONCURRENCY = {
+    "yandex": YANDEX_LLM_CONCURRENCY,
+    "openrouter": OPENROUTER_CONCURRENCY,
+    "ocr": OCR_CONCURRENCY,
+}
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _classify(exc: BaseException):
+    """
+    Решает, повторять ли запрос (см. rate_limit.call_with_retries).
+    Общий таймаут запроса не повторяем: он и так покрывает долгую генерацию,
+    а медленного провайдера подменяют hedging и автомат в llm.py.
+    """
+    if isinstance(exc, aiohttp.ClientResponseError):
+        if exc.status not in RETRY_STATUSES:
+            return None
+        retry_after = parse_retry_after((exc.headers or {}).get("Retry-After"))
+        return exc.status == 429, retry_after
+    if isinstance(exc, aiohttp.ClientConnectionError):
+        return False, None
+    return None
+
+
+class ProviderClient:
+    """
+    Долгоживущая keep-alive сессия к одному провайдеру
+    + семафор, ограничивающий число запросов в полёте.
+    """
+
+    def __init__(self, name: str, concurrency: int, timeout: float = LLM_REQUEST_TIMEOUT):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессию создаём лениво: она должна жить в том же event loop, что и бот
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_CONNECTION_LIMIT,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _check_status(self, resp: aiohttp.ClientResponse):
+        if resp.status >= 400:
+            # Тело ответа об ошибке бывает большим — в лог только начало.
+            # 429/5xx повторяются: окончательный отказ залогирует call_with_retries
+            body_head = (await resp.text())[:300]
+            level = logging.DEBUG if resp.status in RETRY_STATUSES else logging.WARNING
+            log_event("http_error", level, provider=self.name, status=resp.status, body=body_head)
+        resp.raise_for_status()
+
+    async def post_json(
+        self,
+        url: str,
+        headers: dict,
+        body: Union[dict, Callable[[], AsyncIterable[bytes]]],
+    ) -> dict:
+        """
+        POST с JSON-телом, возвращает JSON-ответ.
+        body — dict или функция, возвращающая асинхронный генератор готовых байтов JSON
+        (тело уходит потоком, без сборки в памяти; Content-Type/Content-Length тогда задаёт
+        вызывающий). Функция, а не сам генератор — чтобы тело можно было отправить повторно.
+        Запрос проходит через лимит скорости провайдера, 429/5xx/обрывы повторяются;
+        после исчерпания попыток бросает aiohttp.ClientResponseError (или ошибку соединения).
+        """
+        session = self._get_session()
+
+        async def attempt():
+            payload = {"json": body} if isinstance(body, dict) else {"data": body()}
+            async with self._semaphore:
+                async with session.post(url, headers=headers, **payload) as resp:
+                    await self._check_status(resp)
+                    return await resp.json(content_type=None)
+
+        return await call_with_retries(self.name, attempt, _classify)
+
+    async def post_stream(self, url: str, headers: dict, body: dict):
+        """
+        POST со стриминговым ответом: асинхронно отдаёт строки тела по мере прихода
+        (NDJSON у Yandex, SSE "data: ..." у OpenRouter).
+        Повторяется только установка соединения и статус ответа: после первой
+        отданной строки повтор задвоил бы текст у вызывающего.
+        """
+        session = self._get_session()
+
+        async def open_response():
+            resp = await session.post(url, headers=headers, json=body)
+            try:
+                await self._check_status(resp)
+            except BaseException:
+                resp.release()
+                raise
+            return resp
+
+        async with self._semaphore:
+            resp = await call_with_retries(self.name, open_response, _classify)
+            try:
+                async for raw_line in resp.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if line:
+                        yield line
+            finally:
+                resp.release()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_CLIENTS: Dict[str, ProviderClient] = {}
+
+
+def get_client(provider: str) -> ProviderClient:
+    """Возвращает общий клиент для провайдера (yandex / openrouter / ...)."""
+    client = _CLIENTS.get(provider)
+    if client is None:
+        client = ProviderClient(provider, PROVIDER_CONCURRENCY.get(provider, 10))
+        _CLIENTS[provider] = client
+    return client
+
+
+async def close_clients():
+    """Закрывает все сессии — вызывается при остановке бота."""
+    for client in _CLIENTS.values():
+        await client.close()
+    _CLIENTS.clear()
@@ -0,0 +1,211 @@
+# services/jobs.py
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import JOB_WORKERS, JOB_PER_USER, JOB_POSITION_UPDATE_INTERVAL
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем (/cancel)."""
+
+
+class Job:
+    def __init__(self, user_id: int, func: Callable[[], Awaitable], on_position=None):
+        self.user_id = user_id
+        self.func = func
+        self.on_position = on_position
+        self.position: Optional[int] = None
+        # Последняя показанная пользователю позиция и когда её показали
+        self.reported_position: Optional[int] = None
+        self.reported_at = 0.0
+        self.report_scheduled = False
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self._done = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        """Ждём результат; JobCancelled — если задачу отменили."""
+        return await self._done
+
+
+class JobScheduler:
+    """
+    Очередь генерации карт:
+    - одновременно выполняется не больше workers задач;
+    - у одного пользователя — не больше per_user задач;
+    - пользователи обслуживаются по кругу (round-robin), поэтому тот,
+      кто прислал десять файлов, не задерживает того, кто прислал один.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, per_user: int = JOB_PER_USER):
+        self.workers = workers
+        self.per_user = per_user
+        self._pending: Dict[int, deque] = {}
+        self._order: deque = deque()
+        self._running: Dict[int, set] = {}
+        # Ссылки на задачи обновления позиций — иначе сборщик мусора может снять их на ходу
+        self._report_tasks: set = set()
+
+    @property
+    def running_count(self) -> int:
+        return sum(len(jobs) for jobs in self._running.values())
+
+    def submit(self, user_id: int, func: Callable[[], Awaitable], on_position=None) -> Job:
+        """
+        Ставит задачу в очередь. func — корутинная функция без аргументов.
+        on_position(position) вызывается, пока задача ждёт своей очереди.
+        """
+        job = Job(user_id, func, on_position)
+        if user_id not in self._pending:
+            self._pending[user_id] = deque()
+            self._order.append(user_id)
+        self._pending[user_id].append(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, user_id: int) -> int:
+        """Отменяет все задачи пользователя — и ждущие, и выполняющиеся."""
+        count = 0
+        for job in self._pending.pop(user_id, deque()):
+            job.cancelled = True
+            job._done.set_exception(JobCancelled())
+            count += 1
+        if user_id in self._order:
+            self._order.remove(user_id)
+
+        for job in list(self._running.get(user_id, ())):
+            job.cancelled = True
+            job.task.cancel()
+            count += 1
+
+        self._dispatch()
+        return count
+
+    def _dispatch(self):
+        # Запускаем задачи, пока есть свободные воркеры и пользователи, у которых есть что запускать
+        while self.running_count < self.workers:
+            user_id = self._next_user()
+            if user_id is None:
+                break
+            job = self._pending[user_id].popleft()
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                self._order.remove(user_id)
+            self._start(job)
+
+        self._report_positions()
+
+    def _next_user(self) -> Optional[int]:
+        for _ in range(len(self._order)):
+            user_id = self._order[0]
+            self._order.rotate(-1)
+            if len(self._running.get(user_id, ())) < self.per_user:
+                return user_id
+        return None
+
+    def _start(self, job: Job):
+        job.position = None
+        self._running.setdefault(job.user_id, set()).add(job)
+        job.task = asyncio.create_task(job.func())
+        job.task.add_done_callback(lambda task, job=job: self._finish(job, task))
+
+    def _finish(self, job: Job, task: asyncio.Task):
+        running = self._running.get(job.user_id)
+        if running is not None:
+            running.discard(job)
+            if not running:
+                del self._running[job.user_id]
+
+        if not job._done.done():
+            if task.cancelled():
+                job._done.set_exception(JobCancelled())
+            elif task.exception() is not None:
+                job._done.set_exception(task.exception())
+            else:
+                job._done.set_result(task.result())
+
+        self._dispatch()
+
+    def _report_positions(self):
+        """
+        Позиция в очереди с учётом round-robin: перед i-й задачей пользователя
+        пройдут его i задач и по столько же задач каждого другого пользователя
+        (плюс одна — у тех, кто стоит в круге раньше).
+        """
+        order = list(self._order)
+        for rank, user_id in enumerate(order):
+            for i, job in enumerate(self._pending[user_id]):
+                ahead = i
+                for other_rank, other_id in enumerate(order):
+                    if other_id == user_id:
+                        continue
+                    limit = i + 1 if other_rank < rank else i
+                    ahead += min(len(self._pending[other_id]), limit)
+                job.position = ahead + 1
+                if job.on_position is not None and job.position != job.reported_position:
+                    self._schedule_report(job)
+
+    def _schedule_report(self, job: Job):
+        """
+        Обновление позиции — не чаще раза в JOB_POSITION_UPDATE_INTERVAL на задачу:
+        пока ждём интервал, позиция может смениться ещё несколько раз — покажем последнюю.
+        """
+        if job.report_scheduled:
+            return
+        job.report_scheduled = True
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, job.reported_at + JOB_POSITION_UPDATE_INTERVAL - loop.time())
+        task = asyncio.create_task(self._report(job, delay))
+        self._report_tasks.add(task)
+        task.add_done_callback(self._report_tasks.discard)
+
+    async def _report(self, job: Job, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        job.report_scheduled = False
+        # Задача уже запущена/отменена или позиция вернулась к показанной — править нечего
+        if job.position is None or job.cancelled or job.position == job.reported_position:
+            return
+        job.reported_position = job.position
+        job.reported_at = asyncio.get_running_loop().time()
+        await job.on_position(job.position)
+
+
+SCHEDULER = JobScheduler()
+
+
+# ОТМЕНА МЕЖДУ ПРОЦЕССАМИ
+#
+# В webhook-режиме с несколькими воркерами у каждого процесса свой SCHEDULER, а /cancel
+# может попасть не в тот процесс, где идёт генерация. Тогда отмена рассылается всем
+# воркерам через Redis pub/sub (тот же Redis, что хранит FSM).
+
+CANCEL_CHANNEL = "mapbot:jobs:cancel"
+_cancel_redis = None
+
+
+async def cancel_user_jobs(user_id: int) -> int:
+    """Отменяет задачи пользователя в этом процессе и, если включено, во всех остальных воркерах."""
+    count = SCHEDULER.cancel(user_id)
+    if _cancel_redis is not None:
+        await _cancel_redis.publish(CANCEL_CHANNEL, str(user_id))
+    return count
+
+
+async def _listen_for_cancels(redis):
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(CANCEL_CHANNEL)
+    try:
+        async for message in pubsub.listen():
+            if message.get("type") == "message":
+                SCHEDULER.cancel(int(message["data"]))
+    finally:
+        await pubsub.aclose()
+
+
+def start_cancel_broadcast(redis) -> asyncio.Task:
+    """Подписывает процесс на отмены из других воркеров; задачу нужно отменить при остановке."""
+    global _cancel_redis
+    _cancel_redis = redis
+    return asyncio.create_task(_listen_for_cancels(redis))
@@ -1,176 +1,621 @@
-import json
-import requests
-
-from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_API_URL, YANDEX_OCR_URL, YANDEX_URL, OPENROUTER_API_KEY, OPENROUTER_API_URL
-
-MODEL_MAPPING = {
-    "YandexGPT 🇷🇺": "yandexgpt",
-    "GPT-4o Mini 🤖": "openai/gpt-4o-mini",
-    "Gemini 2.0 Flash ⚡️": "google/gemini-3-flash-preview",
-    "DeepSeek R1 🐋": "arcee-ai/trinity-large-preview:free",
-}
-
-SYSTEM_PROMPT = """
-Ты помощник, который строит структурированную интеллект-карту (mindmap) документа.
-
-Отвечай СТРОГО в JSON, без текста до или после.
-Формат:
-
-{
-  "title": "Краткое название карты",
-  "nodes": [
-    {
-      "title": "Краткий заголовок узла",
-      "children": [
-        {
-          "title": "Подузел",
-          "children": []
-        }
-      ]
-    }
-  ]
-}
-
-Правила:
-- Только JSON, без комментариев и пояснений.
-- title и у корня, и у узлов — короткие фразы.
-- children — массив таких же объектов, можно делать 1–2 уровня вложенности.
-- Не используй null, если нет детей — ставь "children": [].
-- Пиши по-русски.
-"""
-
-DEPTH_HINTS = {
-    "Лёгкая": "Сделай очень краткую карту, только ключевые идеи.",
-    "Средняя": "Сбалансированная карта с основными пунктами.",
-    "Глубокая": "Детальная карта с логической структурой.",
-}
-
-
-def generate_with_yandex(prompt):
-    headers = {
-        "Authorization": f"Api-Key {YANDEX_API_KEY}",
-        "Content-Type": "application/json",
-        "x-folder-id": YANDEX_FOLDER_ID,
-    }
-    body = {
-        "modelUri": YANDEX_URL,
-        "completionOptions": {
-            "stream": False,
-            "temperature": 0.3,
-            "maxTokens": "2000",
-        },
-        "messages": [
-            {"role": "system", "text": SYSTEM_PROMPT},
-            {"role": "user", "text": prompt},
-        ],
-        "jsonObject": True,
-    }
-    resp = requests.post(YANDEX_API_URL, headers=headers, data=json.dumps(body))
-    resp.raise_for_status()
-    data = resp.json()
-    return data["result"]["alternatives"][0]["message"]["text"]
-
-def generate_with_openrouter(prompt, model_id):
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://telegram.org", # Требование OpenRouter
-        "X-Title": "MapBot",
-    }
-    
-    # Для DeepSeek R1 лучше не использовать json_object, он сам справляется,
-    # но для остальных (GPT, Gemini) это повышает стабильность.
-    response_format = {"type": "json_object"} if "deepseek" not in model_id else None
-
-    body = {
-        "model": model_id,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.3,
-        "response_format": response_format
-    }
-
-    resp = requests.post(OPENROUTER_API_URL, headers=headers, data=json.dumps(body))
-    
-    if resp.status_code != 200:
-        print(f"OpenRouter Error: {resp.text}")
-        
-    resp.raise_for_status()
-    data = resp.json()
-    return data["choices"][0]["message"]["content"]
-
-
-def generate_markmap(text: str, depth: str, model_name: str = "YandexGPT 🇷🇺") -> dict:
-    """
-    Возвращает dict с структурой карты.
-    model_name: текст с кнопки (ключ из MODEL_MAPPING)
-    """
-    prompt = f"""
-Контекст документа:
-{text}
-
-Глубина анализа: {DEPTH_HINTS.get(depth, "")}
-"""
-    
-    model_id = MODEL_MAPPING.get(model_name, "yandexgpt")
-    print(f"Using model: {model_name} -> {model_id}")
-
-    try:
-        if model_id == "yandexgpt":
-            content = generate_with_yandex(prompt)
-        else:
-            content = generate_with_openrouter(prompt, model_id)
-
-        print("RAW LLM CONTENT:", repr(content))
-        
-        # Очистка markdown блоков json, если они есть
-        clean_content = content.replace("```json", "").replace("```", "").strip()
-        obj = json.loads(clean_content)
-
-        title = obj.get("title") or "Без названия"
-        nodes = obj.get("nodes") or []
-
-        # Плоский список строк для Telegram
-        flat_lines = []
-
-        def walk(node, level=0):
-            prefix = "  " * level + "- "
-            flat_lines.append(prefix + str(node.get("title", "")).strip())
-            for child in node.get("children", []) or []:
-                walk(child, level + 1)
-
-        for n in nodes:
-            walk(n, level=0)
-
-        if not flat_lines:
-            flat_lines = ["- Ошибка структуры данных"]
-
-        # Markmap markdown
-        markmap_lines = [f"# {title}"]
-
-        def walk_markmap(node, level=1):
-            indent = "  " * level
-            markmap_lines.append(f"{indent}- {str(node.get('title', '')).strip()}")
-            for child in node.get("children", []) or []:
-                walk_markmap(child, level + 1)
-
-        for n in nodes:
-            walk_markmap(n, level=1)
-
-        return {
-            "title": title,
-            "nodes": nodes,
-            "flat": flat_lines,
-            "markmap": "\n".join(markmap_lines),
-        }
-
-    except Exception as e:
-        print("PARSE/GENERATE ERROR:", e)
-        return {
-            "title": "Ошибка генерации",
-            "nodes": [],
-            "flat": ["- Произошла ошибка при обращении к нейросети"],
-            "markmap": "# Ошибка генерации\n  - Попробуйте другую модель",
-        }
+import re
+import html
+import json
+import time
+import asyncio
+import hashlib
+import logging
+
+import aiohttp
+
+from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_API_URL, YANDEX_OCR_URL, YANDEX_URL, OPENROUTER_API_KEY, OPENROUTER_API_URL
+from config import MARKMAP_CACHE_ENABLED, MARKMAP_CACHE_DIR, MARKMAP_CACHE_MAX_BYTES, MARKMAP_CACHE_TTL
+from config import LLM_CHUNK_CHARS, LLM_CHUNK_CONCURRENCY
+from config import LLM_HEDGING, LLM_HEDGE_MODELS
+from services.cache import DiskCache
+from services.http_client import get_client
+from services.stream_parser import TreeStreamParser
+from services.metrics import LLM_SECONDS, CACHE_HITS, CACHE_MISSES, LLM_HEDGES, LLM_HEDGE_WINS, log_event
+from services.resilience import CircuitOpen, get_breaker, get_latency
+from services.text_normalize import normalize_text, estimate_tokens, trim_to_tokens, CHARS_PER_TOKEN, DEFAULT_CHARS_PER_TOKEN
+
+MODEL_MAPPING = {
+    "YandexGPT 🇷🇺": "yandexgpt",
+    "GPT-4o Mini 🤖": "openai/gpt-4o-mini",
+    "Gemini 2.0 Flash ⚡️": "google/gemini-3-flash-preview",
+    "DeepSeek R1 🐋": "arcee-ai/trinity-large-preview:free",
+}
+
+# Сколько токенов (по оценке estimate_tokens) может занимать один промпт к модели.
+# Документ целиком бюджетом не обрезается: длинный текст идёт map-reduce кусками,
+# и куски режутся так, чтобы каждый промпт укладывался в бюджет модели.
+MODEL_TOKEN_BUDGET = {
+    "yandexgpt": 30000,
+    "openai/gpt-4o-mini": 100000,
+    "google/gemini-3-flash-preview": 200000,
+    "arcee-ai/trinity-large-preview:free": 30000,
+}
+DEFAULT_TOKEN_BUDGET = 30000
+
+
+def _token_budget(model_id: str) -> int:
+    return MODEL_TOKEN_BUDGET.get(model_id, DEFAULT_TOKEN_BUDGET)
+
+SYSTEM_PROMPT = """
+Ты помощник, который строит структурированную интеллект-карту (mindmap) документа.
+
+Отвечай СТРОГО в JSON, без текста до или после.
+Формат:
+
+{
+  "title": "Краткое название карты",
+  "nodes": [
+    {
+      "title": "Краткий заголовок узла",
+      "children": [
+        {
+          "title": "Подузел",
+          "children": []
+        }
+      ]
+    }
+  ]
+}
+
+Правила:
+- Только JSON, без комментариев и пояснений.
+- title и у корня, и у узлов — короткие фразы.
+- children — массив таких же объектов, можно делать 1–2 уровня вложенности.
+- Не используй null, если нет детей — ставь "children": [].
+- Пиши по-русски.
+"""
+
+DEPTH_HINTS = {
+    "Лёгкая": "Сделай очень краткую карту, только ключевые идеи.",
+    "Средняя": "Сбалансированная карта с основными пунктами.",
+    "Глубокая": "Детальная карта с логической структурой.",
+}
+
+DOCUMENT_PROMPT = """
+Контекст документа:
+{text}
+
+Глубина анализа: {depth_hint}
+"""
+
+# Сведение карт частей в одну (map-reduce для длинных документов)
+CONSOLIDATE_PROMPT = """
+Ниже — интеллект-карты отдельных частей одного документа, по порядку.
+Объедини их в одну карту всего документа: убери повторы, объедини близкие
+разделы, сохрани порядок изложения. Ответ — в том же JSON-формате.
+
+Части:
+{parts}
+
+Глубина анализа: {depth_hint}
+"""
+
+
+# КЭШ ГОТОВЫХ КАРТ
+
+# Версия промпта: всё, от чего зависит готовая карта, кроме текста, глубины и модели, —
+# промпты, размер кусков map-reduce и бюджеты токенов. Поменялось что-то из этого —
+# старые записи кэша перестают совпадать
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps(
+        [
+            SYSTEM_PROMPT,
+            DEPTH_HINTS,
+            DOCUMENT_PROMPT,
+            CONSOLIDATE_PROMPT,
+            LLM_CHUNK_CHARS,
+            MODEL_TOKEN_BUDGET,
+            DEFAULT_TOKEN_BUDGET,
+            CHARS_PER_TOKEN,
+            DEFAULT_CHARS_PER_TOKEN,
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    ).encode("utf-8")
+).hexdigest()[:16]
+
+MARKMAP_CACHE = DiskCache(MARKMAP_CACHE_DIR, max_bytes=MARKMAP_CACHE_MAX_BYTES, ttl=MARKMAP_CACHE_TTL)
+
+
+def _markmap_cache_key(text: str, depth: str, model_id: str) -> str:
+    # Нормализуем пробелы, чтобы одинаковый документ из разных парсеров давал один ключ
+    normalized = re.sub(r"\s+", " ", text).strip()
+    text_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{PROMPT_VERSION}:{model_id}:{depth}:{text_hash}"
+
+
+def _yandex_request(prompt, stream=False):
+    headers = {
+        "Authorization": f"Api-Key {YANDEX_API_KEY}",
+        "Content-Type": "application/json",
+        "x-folder-id": YANDEX_FOLDER_ID,
+    }
+    body = {
+        "modelUri": YANDEX_URL,
+        "completionOptions": {
+            "stream": stream,
+            "temperature": 0.3,
+            "maxTokens": "2000",
+        },
+        "messages": [
+            {"role": "system", "text": SYSTEM_PROMPT},
+            {"role": "user", "text": prompt},
+        ],
+        "jsonObject": True,
+    }
+    return headers, body
+
+
+def _openrouter_request(prompt, model_id, stream=False):
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://telegram.org", # Требование OpenRouter
+        "X-Title": "MapBot",
+    }
+    
+    # Для DeepSeek R1 лучше не использовать json_object, он сам справляется,
+    # но для остальных (GPT, Gemini) это повышает стабильность.
+    response_format = {"type": "json_object"} if "deepseek" not in model_id else None
+
+    body = {
+        "model": model_id,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.3,
+        "response_format": response_format
+    }
+    if stream:
+        body["stream"] = True
+    return headers, body
+
+
+async def generate_with_yandex(prompt):
+    headers, body = _yandex_request(prompt)
+    data = await get_client("yandex").post_json(YANDEX_API_URL, headers, body)
+    return data["result"]["alternatives"][0]["message"]["text"]
+
+async def generate_with_openrouter(prompt, model_id):
+    headers, body = _openrouter_request(prompt, model_id)
+    data = await get_client("openrouter").post_json(OPENROUTER_API_URL, headers, body)
+    return data["choices"][0]["message"]["content"]
+
+
+# СТРИМИНГ: генераторы отдают новые куски текста ответа
+
+async def stream_with_yandex(prompt):
+    """
+    Yandex в режиме stream присылает NDJSON, где каждая строка содержит
+    весь накопленный текст — отдаём только прирост.
+    """
+    headers, body = _yandex_request(prompt, stream=True)
+    seen = 0
+    async for line in get_client("yandex").post_stream(YANDEX_API_URL, headers, body):
+        data = json.loads(line)
+        text = data["result"]["alternatives"][0]["message"]["text"]
+        if len(text) > seen:
+            yield text[seen:]
+            seen = len(text)
+
+async def stream_with_openrouter(prompt, model_id):
+    """
+    OpenRouter стримит в формате SSE: строки "data: {...}" с дельтами, в конце "data: [DONE]".
+    """
+    headers, body = _openrouter_request(prompt, model_id, stream=True)
+    async for line in get_client("openrouter").post_stream(OPENROUTER_API_URL, headers, body):
+        # Комментарии SSE (": OPENROUTER PROCESSING") и прочие служебные строки пропускаем
+        if not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        data = json.loads(payload)
+        choices = data.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        if delta:
+            yield delta
+
+
+async def _stream_completion(prompt, model_id, on_progress):
+    """
+    Собираем ответ из стрима и по ходу сообщаем о новых узлах верхнего уровня:
+    on_progress(titles) вызывается со всем списком найденных на данный момент узлов.
+    """
+    if model_id == "yandexgpt":
+        chunks = stream_with_yandex(prompt)
+    else:
+        chunks = stream_with_openrouter(prompt, model_id)
+
+    parser = TreeStreamParser()
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        if parser.feed(chunk):
+            await on_progress(list(parser.top_level))
+    return "".join(parts)
+
+
+async def _complete(prompt, model_id, on_progress=None):
+    with LLM_SECONDS.time(model=model_id):
+        if on_progress is not None:
+            content = await _stream_completion(prompt, model_id, on_progress)
+        elif model_id == "yandexgpt":
+            content = await generate_with_yandex(prompt)
+        else:
+            content = await generate_with_openrouter(prompt, model_id)
+    log_event("llm_completed", model=model_id, prompt_chars=len(prompt), answer_chars=len(content or ""))
+    return content
+
+
+# HEDGING И АВТОМАТЫ ПО ПРОВАЙДЕРАМ
+
+def _is_provider_failure(exc: BaseException) -> bool:
+    """
+    Ошибка, за которую отвечает провайдер: обрыв соединения, таймаут, HTTP 5xx.
+    Невалидный JSON, пустое дерево, 4xx и ожидание в нашей же очереди лимитов
+    (RateLimitTimeout) автомат не размыкают — это проблема конкретного документа
+    или нашей квоты, а не недоступность модели для всех пользователей.
+    """
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500
+    return isinstance(exc, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+async def _attempt(prompt, model_id, on_progress=None):
+    """
+    Один запрос к модели, разобранный в (title, nodes, model_id).
+    Невалидный JSON или пустое дерево — ошибка (для hedging это повод спросить
+    запасную модель), но в автомат провайдера идут только его собственные сбои.
+    """
+    breaker = get_breaker(model_id)
+    breaker.acquire()
+    started = time.monotonic()
+    try:
+        title, nodes = _parse_tree(await _complete(prompt, model_id, on_progress))
+        if not nodes:
+            raise ValueError("модель вернула пустое дерево")
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        if _is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    breaker.record_success()
+    get_latency(model_id).observe(time.monotonic() - started)
+    return title, nodes, model_id
+
+
+def _backup_model(model_id):
+    """Следующая модель из LLM_HEDGE_MODELS, у которой не разомкнут автомат."""
+    for candidate in LLM_HEDGE_MODELS:
+        if candidate != model_id and not get_breaker(candidate).is_open:
+            return candidate
+    return None
+
+
+async def _generate_tree(prompt, model_id, on_progress=None):
+    """
+    Запрос к модели с защитой от «хвостов»:
+    - если автомат модели разомкнут — сразу идём в запасную модель;
+    - в режиме LLM_HEDGING, если ответа нет дольше перцентиля обычных задержек модели
+      (или она упала), параллельно спрашиваем запасную; побеждает первое валидное
+      дерево, второй запрос отменяется. Дубль уходит только на медленный хвост,
+      поэтому средняя стоимость почти не растёт.
+    Возвращает (title, nodes, id модели, которая на самом деле ответила).
+    """
+    if get_breaker(model_id).is_open:
+        backup = _backup_model(model_id)
+        if backup is None:
+            raise CircuitOpen(f"{model_id}: провайдер временно отключён, запасной модели нет")
+        log_event("llm_failover", model=model_id, backup=backup)
+        return await _attempt(prompt, backup)
+
+    if not LLM_HEDGING:
+        return await _attempt(prompt, model_id, on_progress)
+
+    # Все задачи создаются внутри try: отмена (/cancel) в любой момент, в том числе
+    # во время ожидания перед дублем, снимает и основной запрос, и запасной
+    tasks = []
+    try:
+        primary = asyncio.create_task(_attempt(prompt, model_id, on_progress))
+        tasks.append(primary)
+        delay = get_latency(model_id).hedge_delay()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        backup = _backup_model(model_id)
+        if backup is None:
+            return await primary
+
+        LLM_HEDGES.inc(model=model_id)
+        log_event("llm_hedge", model=model_id, backup=backup, delay=round(delay, 2), primary_failed=bool(done))
+        secondary = asyncio.create_task(_attempt(prompt, backup))
+        tasks.append(secondary)
+        roles = {primary: "primary", secondary: "backup"}
+        pending = {secondary} if done else {primary, secondary}
+        errors = [primary.exception()] if done else []
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(finished, key=lambda t: roles[t] != "primary"):
+                if task.exception() is None:
+                    LLM_HEDGE_WINS.inc(model=model_id, winner=roles[task])
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+
+def _parse_tree(content: str):
+    """Разбираем ответ модели в (title, nodes)."""
+
+    # Очистка markdown блоков json, если они есть
+    clean_content = content.replace("```json", "").replace("```", "").strip()
+    obj = json.loads(clean_content)
+
+    title = obj.get("title") or "Без названия"
+    nodes = obj.get("nodes") or []
+    return title, nodes
+
+
+def _build_prompt(text: str, depth: str) -> str:
+    return DOCUMENT_PROMPT.format(text=text, depth_hint=DEPTH_HINTS.get(depth, ""))
+
+
+# MAP-REDUCE ДЛЯ БОЛЬШИХ ДОКУМЕНТОВ
+
+def _split_text(text: str, max_chars: int) -> list[str]:
+    """
+    Режем текст на куски не длиннее max_chars по структурным границам:
+    сначала по пустым строкам (абзацы/разделы), если их нет — по строкам.
+    Слишком длинный абзац режется жёстко по размеру.
+    """
+    blocks = re.split(r"\n\s*\n", text)
+    if len(blocks) == 1:
+        blocks = text.split("\n")
+
+    chunks = []
+    current = []
+    size = 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append("\n\n".join(current))
+        current = []
+        size = 0
+
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        while len(block) > max_chars:
+            flush()
+            chunks.append(block[:max_chars])
+            block = block[max_chars:]
+        if current and size + len(block) > max_chars:
+            flush()
+        current.append(block)
+        size += len(block) + 2
+    flush()
+    return chunks
+
+
+def _prune(nodes: list, depth: int) -> list:
+    """Оставляем только depth уровней дерева — для компактного промпта сведения."""
+    if depth <= 0:
+        return []
+    return [
+        {
+            "title": str(n.get("title", "")).strip(),
+            "children": _prune(n.get("children", []) or [], depth - 1),
+        }
+        for n in nodes
+    ]
+
+
+def _chunk_chars(model_id: str, depth: str) -> int:
+    """
+    Длина куска текста для одного запроса: не больше LLM_CHUNK_CHARS и такая,
+    чтобы промпт с куском уложился в бюджет токенов модели даже для
+    «дорогого» текста (берём меньшее из отношений символов к токену).
+    """
+    overhead = estimate_tokens(SYSTEM_PROMPT + _build_prompt("", depth), model_id)
+    chars_per_token = min(CHARS_PER_TOKEN.get(model_id, DEFAULT_CHARS_PER_TOKEN))
+    fits = int((_token_budget(model_id) - overhead) * chars_per_token)
+    return max(1000, min(LLM_CHUNK_CHARS, fits))
+
+
+async def _generate_chunked(text: str, depth: str, model_id: str, chunk_chars: int, on_progress=None):
+    """
+    Map: карты по кускам генерируются параллельно (не больше LLM_CHUNK_CONCURRENCY на документ).
+    Reduce: один запрос сводит частичные деревья в общее; если он не удался
+    или не влезает в бюджет модели — просто склеиваем узлы частей по порядку.
+    Возвращает (title, nodes, множество id моделей, ответивших на запросы).
+    """
+    chunks = _split_text(text, chunk_chars)
+    log_event("llm_map_reduce", model=model_id, chunks=len(chunks), chars=len(text))
+
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+    done_titles = []
+
+    async def map_chunk(chunk):
+        async with semaphore:
+            title, nodes, answered_by = await _generate_tree(_build_prompt(chunk, depth), model_id)
+        if on_progress is not None:
+            done_titles.extend(str(n.get("title", "")).strip() for n in nodes)
+            await on_progress(list(done_titles))
+        return title, nodes, answered_by
+
+    results = await asyncio.gather(*(map_chunk(c) for c in chunks), return_exceptions=True)
+
+    parts = []
+    models = set()
+    for idx, res in enumerate(results):
+        if isinstance(res, Exception):
+            log_event("llm_chunk_error", logging.WARNING, model=model_id, chunk=idx, error=str(res))
+            continue
+        parts.append({"title": res[0], "nodes": res[1]})
+        models.add(res[2])
+
+    if not parts:
+        raise RuntimeError("Ни один кусок документа не удалось обработать")
+    if len(parts) == 1:
+        return parts[0]["title"], parts[0]["nodes"], models
+
+    merged_nodes = [n for part in parts for n in part["nodes"]]
+    try:
+        compact = [{"title": p["title"], "nodes": _prune(p["nodes"], 2)} for p in parts]
+        prompt = CONSOLIDATE_PROMPT.format(
+            parts=json.dumps(compact, ensure_ascii=False),
+            depth_hint=DEPTH_HINTS.get(depth, ""),
+        )
+        tokens = estimate_tokens(SYSTEM_PROMPT + prompt, model_id)
+        if tokens > _token_budget(model_id):
+            # Резать JSON частей нельзя — сводить такую карту не будем
+            log_event("llm_consolidation_skipped", model=model_id, parts=len(parts), tokens=tokens)
+        else:
+            title, nodes, answered_by = await _generate_tree(prompt, model_id)
+            if nodes:
+                return title, nodes, models | {answered_by}
+    except Exception as e:
+        log_event("llm_consolidation_error", logging.WARNING, model=model_id, error=str(e))
+
+    return parts[0]["title"], merged_nodes, models
+
+
+def markmap_tree(title: str, nodes: list) -> dict:
+    """
+    Дерево в формате узлов markmap (то, что возвращает Transformer из markmap-lib):
+    mini-app отрисовывает его сразу, без разбора Markdown в браузере.
+    content — HTML, поэтому заголовки экранируем.
+    """
+    def convert(node, depth):
+        return {
+            "type": "list_item",
+            "depth": depth,
+            "content": html.escape(str(node.get("title", "")).strip()),
+            "children": [convert(child, depth + 1) for child in node.get("children", []) or []],
+        }
+
+    return {
+        "type": "heading",
+        "depth": 0,
+        "content": html.escape(str(title).strip()),
+        "children": [convert(n, 1) for n in nodes],
+    }
+
+
+async def generate_markmap(
+    text: str,
+    depth: str,
+    model_name: str = "YandexGPT 🇷🇺",
+    use_cache: bool = True,
+    on_progress=None,
+) -> dict:
+    """
+    Возвращает dict с структурой карты.
+    model_name: текст с кнопки (ключ из MODEL_MAPPING)
+    use_cache: False — всегда идти в LLM (результат всё равно попадёт в кэш)
+    on_progress: async-колбэк (titles: list[str]); если передан, ответ модели
+        стримится и колбэк вызывается по мере появления узлов верхнего уровня
+    Текст нормализуется; если он не помещается в один запрос (LLM_CHUNK_CHARS
+    или MODEL_TOKEN_BUDGET модели), обрабатывается в режиме map-reduce.
+    """
+    model_id = MODEL_MAPPING.get(model_name, "yandexgpt")
+
+    # Чистим текст до ключа кэша, чтобы тот же документ с другими пробелами
+    # попадал в ту же запись
+    raw_chars = len(text)
+    text = normalize_text(text)
+    log_event(
+        "llm_input",
+        model=model_id,
+        raw_chars=raw_chars,
+        chars=len(text),
+        tokens=estimate_tokens(text, model_id),
+    )
+
+    cache_key = _markmap_cache_key(text, depth, model_id)
+    if MARKMAP_CACHE_ENABLED and use_cache:
+        cached = await MARKMAP_CACHE.aget(cache_key)
+        if cached:
+            CACHE_HITS.inc(cache="markmap")
+            return cached
+        CACHE_MISSES.inc(cache="markmap")
+
+    try:
+        chunk_chars = _chunk_chars(model_id, depth)
+        if len(text) > chunk_chars:
+            title, nodes, answered_by = await _generate_chunked(text, depth, model_id, chunk_chars, on_progress)
+        else:
+            # Кусок по длине помещается; обрезка — страховка на случай неточной оценки токенов
+            budget = _token_budget(model_id) - estimate_tokens(SYSTEM_PROMPT + _build_prompt("", depth), model_id)
+            prompt = _build_prompt(trim_to_tokens(text, model_id, budget), depth)
+            title, nodes, answered = await _generate_tree(prompt, model_id, on_progress)
+            answered_by = {answered}
+
+        # Плоский список строк для Telegram
+        flat_lines = []
+
+        def walk(node, level=0):
+            prefix = "  " * level + "- "
+            flat_lines.append(prefix + str(node.get("title", "")).strip())
+            for child in node.get("children", []) or []:
+                walk(child, level + 1)
+
+        for n in nodes:
+            walk(n, level=0)
+
+        if not flat_lines:
+            flat_lines = ["- Ошибка структуры данных"]
+
+        # Markmap markdown
+        markmap_lines = [f"# {title}"]
+
+        def walk_markmap(node, level=1):
+            indent = "  " * level
+            markmap_lines.append(f"{indent}- {str(node.get('title', '')).strip()}")
+            for child in node.get("children", []) or []:
+                walk_markmap(child, level + 1)
+
+        for n in nodes:
+            walk_markmap(n, level=1)
+
+        result = {
+            "title": title,
+            "nodes": nodes,
+            "flat": flat_lines,
+            "markmap": "\n".join(markmap_lines),
+        }
+        if answered_by != {model_id}:
+            # Ответила (целиком или частично) запасная модель — под ключом выбранной
+            # её дерево не кэшируем, иначе оно выдавалось бы как ответ выбранной модели
+            log_event("markmap_not_cached", model=model_id, answered_by=sorted(answered_by))
+        elif MARKMAP_CACHE_ENABLED and nodes:
+            await MARKMAP_CACHE.aset(cache_key, result)
+        return result
+
+    except Exception as e:
+        log_event("markmap_generate_error", logging.ERROR, model=model_id, error=str(e))
+        return {
+            "title": "Ошибка генерации",
+            "nodes": [],
+            "flat": ["- Произошла ошибка при обращении к нейросети"],
+            "markmap": "# Ошибка генерации\n  - Попробуйте другую модель",
+        }
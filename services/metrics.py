@@ -0,0 +1,168 @@
+# services/metrics.py
+"""
+Метрики в формате Prometheus (text exposition) и структурированные логи.
+
+Гистограммы длительностей по стадиям конвейера, счётчики ошибок и попаданий в кэш.
+Отдаются по HTTP на /metrics (см. start_metrics_server), без сторонних зависимостей.
+"""
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger("mapbot")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_REGISTRY = []
+_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # ключ меток -> [счётчики по бакетам, сумма, количество]
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Замер блока кода (работает и вокруг await).
+        Исключение внутри блока увеличивает bot_errors_total{stage=<имя гистограммы>}.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            ERRORS.inc(stage=self.name, **labels)
+            raise
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def render() -> str:
+    with _lock:
+        lines = []
+        for metric in _REGISTRY:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# МЕТРИКИ КОНВЕЙЕРА
+
+DOWNLOAD_SECONDS = Histogram("bot_download_seconds", "Скачивание файла из Telegram")
+EXTRACT_SECONDS = Histogram("bot_extract_seconds", "Извлечение текста по формату")
+OCR_SECONDS = Histogram("bot_ocr_seconds", "Один запрос к Yandex OCR")
+LLM_SECONDS = Histogram("bot_llm_seconds", "Один запрос к LLM по модели")
+S3_UPLOAD_SECONDS = Histogram("bot_s3_upload_seconds", "Загрузка объекта в S3")
+TELEGRAM_SECONDS = Histogram("bot_telegram_request_seconds", "Запросы к Telegram Bot API по методу")
+RATE_LIMIT_WAIT_SECONDS = Histogram("bot_rate_limit_wait_seconds", "Ожидание в очереди к внешнему API")
+
+ERRORS = Counter("bot_errors_total", "Ошибки по стадиям")
+CACHE_HITS = Counter("bot_cache_hits_total", "Попадания в кэш")
+CACHE_MISSES = Counter("bot_cache_misses_total", "Промахи кэша")
+LLM_HEDGES = Counter("bot_llm_hedged_total", "Отправленные запросы-дубли к запасной модели")
+LLM_HEDGE_WINS = Counter("bot_llm_hedge_wins_total", "Чей ответ победил после дубля (primary/backup)")
+BREAKER_TRIPS = Counter("bot_circuit_opened_total", "Срабатывания автомата по провайдерам")
+RETRIES = Counter("bot_api_retries_total", "Повторы запросов к внешним API по причине")
+THROTTLED = Counter("bot_api_throttled_total", "Ответы 429/SlowDown от внешних API")
+
+
+# СТРУКТУРИРОВАННЫЕ ЛОГИ
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    """
+    Одна строка лога: имя события и поля key=value (значения — JSON).
+    Пишем размеры и длительности, а не содержимое запросов/ответов.
+    """
+    parts = [event] + [f"{k}={json.dumps(v, ensure_ascii=False, default=str)}" for k, v in fields.items()]
+    logger.log(level, " ".join(parts))
+
+
+# HTTP-ЭНДПОИНТ И MIDDLEWARE ДЛЯ TELEGRAM
+
+async def metrics_handler(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int):
+    """Поднимает отдельный HTTP-сервер с /metrics; возвращает runner для остановки."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log_event("metrics_server_started", host=host, port=port)
+    return runner
+
+
+class TelegramTimingMiddleware:
+    """Middleware сессии aiogram: время каждого вызова Bot API (sendMessage, editMessageText, getFile...)."""
+
+    async def __call__(self, make_request, bot, method):
+        with TELEGRAM_SECONDS.time(method=type(method).__name__):
+            return await make_request(bot, method)
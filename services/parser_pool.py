@@ -0,0 +1,137 @@
+# services/parser_pool.py
+import asyncio
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from config import PARSER_WORKERS, PARSER_TIMEOUT, PARSER_MEMORY_LIMIT_MB
+
+
+class ParserTimeout(Exception):
+    """Парсер не уложился в PARSER_TIMEOUT секунд."""
+
+
+class ParserCrashed(Exception):
+    """Процесс парсера упал (OOM, segfault и т.п.)."""
+
+
+def _limit_memory(limit_mb: int):
+    """
+    Инициализатор воркера: ограничиваем адресное пространство процесса,
+    чтобы раздувшийся документ получил MemoryError, а не съел всю память машины.
+    На Windows модуля resource нет — там работаем без лимита.
+    """
+    if not limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Не больше PARSER_WORKERS задач в пуле: остальные ждут здесь, а не в очереди executor'а
+_slots: Optional[asyncio.Semaphore] = None
+# Пулы, погашенные из-за чужого таймаута: их задачам-соседям положен повтор без счёта попыток
+_killed_on_timeout = weakref.WeakSet()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PARSER_WORKERS,
+            # spawn: не наследуем потоки и сокеты event loop'а бота
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_limit_memory,
+            initargs=(PARSER_MEMORY_LIMIT_MB,),
+        )
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PARSER_WORKERS)
+    return _slots
+
+
+def _reset_executor(executor: ProcessPoolExecutor, timed_out: bool = False):
+    """
+    Убиваем процессы зависшего/сломанного пула и создаём новый при следующем вызове.
+    ProcessPoolExecutor не умеет снимать одну задачу, поэтому гасим пул целиком.
+    Задачи-соседи не отменяются: они получат BrokenProcessPool и будут заново
+    отправлены в новый пул, а ошибкой завершится только виновная задача.
+    """
+    global _executor
+    if _executor is executor:
+        _executor = None
+    if timed_out:
+        _killed_on_timeout.add(executor)
+    for process in list((executor._processes or {}).values()):
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=False)
+
+
+def _release_when_done(future, loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore):
+    """
+    Слот возвращается, когда завершится сама задача в процессе, а не await над ней:
+    отменённый вызывающий (например, /cancel) не снимает задачу с процесса,
+    и новый документ не должен попасть в занятый пул и тратить свой таймаут на ожидание.
+    """
+    def release(_):
+        try:
+            loop.call_soon_threadsafe(slots.release)
+        except RuntimeError:
+            # event loop уже закрыт — бот останавливается
+            pass
+
+    future.add_done_callback(release)
+
+
+async def run_parser(func, *args, timeout: float = PARSER_TIMEOUT):
+    """
+    Выполняет func(*args) в пуле процессов с жёстким таймаутом.
+    func должна быть функцией уровня модуля (её передают в процесс по имени).
+    Таймаут отсчитывается с момента, когда задача получила свободный процесс:
+    пока пул занят чужими документами, она ждёт слота без таймаута.
+    """
+    loop = asyncio.get_running_loop()
+    slots = _get_slots()
+    crashes = 0
+    while True:
+        await slots.acquire()
+        executor = _get_executor()
+        try:
+            try:
+                future = executor.submit(func, *args)
+            except BaseException:
+                # Задача не ушла в пул (например, он уже сломан) — слот не занят
+                slots.release()
+                raise
+            _release_when_done(future, loop, slots)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            _reset_executor(executor, timed_out=True)
+            raise ParserTimeout(f"{func.__name__}: превышен таймаут {timeout} с")
+        except BrokenProcessPool:
+            if executor in _killed_on_timeout:
+                # Пул погасили из-за чужого зависшего документа — наш не виноват
+                continue
+            _reset_executor(executor)
+            crashes += 1
+            # Пул мог сломать соседний документ — даём своему ещё одну попытку
+            if crashes == 1:
+                continue
+            raise ParserCrashed(f"{func.__name__}: процесс парсера упал")
+
+
+async def shutdown_parsers():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,5 +1,5 @@
-async def update_status(message, text: str):
-    try:
-        await message.edit_text(text)
-    except:
-        pass
+async def update_status(message, text: str):
+    try:
+        await message.edit_text(text)
+    except:
+        pass
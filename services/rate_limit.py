@@ -0,0 +1,172 @@
+# services/rate_limit.py
+"""
+Общий слой допуска запросов ко внешним API (Yandex LLM, OpenRouter, Yandex OCR, S3).
+
+- AdaptiveTokenBucket: у каждого API свой «бак» с начальной скоростью из config.
+  Запросы сверх скорости не падают, а ждут своей очереди (FIFO). На 429 скорость
+  вдвое снижается и бак замирает на Retry-After, на успехах — плавно растёт
+  обратно до исходной (AIMD, как у TCP).
+- call_with_retries: повтор с экспоненциальной задержкой и полным джиттером
+  для временных ошибок (5xx, обрывы соединения) — до RETRY_MAX_ATTEMPTS попыток.
+  Общий таймаут запроса не повторяется: он и так рассчитан на долгий ответ.
+  Ответ «слишком часто» (429/SlowDown) попыткой не считается: запрос встаёт
+  обратно в очередь и ждёт, пока квота не освободится (но не дольше
+  RATE_LIMIT_QUEUE_TIMEOUT). Какие ошибки временные, решает вызывающий — через classify.
+"""
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+
+from config import (
+    YANDEX_LLM_RPS,
+    OPENROUTER_RPS,
+    OCR_RPS,
+    S3_RPS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RATE_LIMIT_QUEUE_TIMEOUT,
+)
+from services.metrics import RATE_LIMIT_WAIT_SECONDS, RETRIES, THROTTLED, log_event
+
+# Начальная (она же максимальная) скорость, запросов в секунду
+ENDPOINT_RPS = {
+    "yandex": YANDEX_LLM_RPS,
+    "openrouter": OPENROUTER_RPS,
+    "ocr": OCR_RPS,
+    "s3": S3_RPS,
+}
+
+
+class RateLimitTimeout(Exception):
+    """Запрос простоял в очереди дольше RATE_LIMIT_QUEUE_TIMEOUT."""
+
+
+class AdaptiveTokenBucket:
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = max(rate / 32, 0.05)
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = None
+
+    def _refill(self, now: float):
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ждёт токен. Очередь честная: asyncio.Lock будит ожидающих по порядку."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now - started > RATE_LIMIT_QUEUE_TIMEOUT:
+                    raise RateLimitTimeout(f"{self.name}: превышено время ожидания в очереди к API")
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - started, endpoint=self.name)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttled(self, pause: float):
+        """Сервер ответил 429: снижаем скорость и замираем на pause секунд."""
+        now = time.monotonic()
+        THROTTLED.inc(endpoint=self.name)
+        # Пачка 429 на запросы, ушедшие одновременно, — один эпизод: скорость режем один раз
+        if now >= self.blocked_until:
+            self.rate = max(self.min_rate, self.rate / 2)
+            log_event("rate_limited", endpoint=self.name, rate=round(self.rate, 2), pause=round(pause, 2))
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + pause)
+
+
+_BUCKETS: dict = {}
+
+
+def get_bucket(name: str) -> AdaptiveTokenBucket:
+    bucket = _BUCKETS.get(name)
+    if bucket is None:
+        bucket = _BUCKETS[name] = AdaptiveTokenBucket(name, ENDPOINT_RPS.get(name, 10))
+    return bucket
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After: число секунд или HTTP-дата."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Полный джиттер: случайная задержка от 0 до base * 2^attempt — повторы не идут «стаей»
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def call_with_retries(name: str, func, classify):
+    """
+    Вызывает async func() через бак API name, повторяя временные ошибки.
+
+    classify(exc) -> None, если ошибка окончательная (повторять нельзя),
+    иначе (throttled, retry_after): throttled — сервер просит сбавить темп (429/SlowDown),
+    retry_after — сколько он просит подождать (или None).
+    Когда попытки или время ожидания исчерпаны, бросает последнюю ошибку.
+    """
+    bucket = get_bucket(name)
+    started = time.monotonic()
+    attempt = 0
+    throttles = 0
+    while True:
+        await bucket.acquire()
+        try:
+            result = await func()
+        except Exception as e:
+            verdict = classify(e)
+            if verdict is None:
+                raise
+            throttled, retry_after = verdict
+            if throttled:
+                throttles += 1
+                if time.monotonic() - started > RATE_LIMIT_QUEUE_TIMEOUT:
+                    log_event("retry_gave_up", logging.WARNING, endpoint=name, reason="throttled",
+                              attempts=attempt + throttles, error=str(e)[:200])
+                    raise
+                # Пауза ложится на весь бак — следующий acquire её выждет вместе с остальными
+                bucket.on_throttled(retry_after if retry_after is not None else _backoff(throttles))
+                delay = 0.0
+            else:
+                attempt += 1
+                if attempt >= RETRY_MAX_ATTEMPTS:
+                    log_event("retry_gave_up", logging.WARNING, endpoint=name, reason="transient",
+                              attempts=attempt + throttles, error=str(e)[:200])
+                    raise
+                delay = _backoff(attempt - 1)
+            RETRIES.inc(endpoint=name, reason="throttled" if throttled else "transient")
+            log_event("retry", logging.DEBUG if throttled else logging.INFO,
+                      endpoint=name, attempt=attempt + throttles, delay=round(delay, 2), error=str(e)[:200])
+            await asyncio.sleep(delay)
+            continue
+        bucket.on_success()
+        return result
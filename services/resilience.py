@@ -0,0 +1,113 @@
+# services/resilience.py
+"""
+Защита от медленных и падающих провайдеров LLM.
+
+- CircuitBreaker: после LLM_BREAKER_FAILURES ошибок подряд провайдер «размыкается»
+  на LLM_BREAKER_COOLDOWN секунд — запросы к нему не отправляются. Затем пропускается
+  один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+- LatencyTracker: скользящее окно длительностей успешных ответов провайдера,
+  из него берётся перцентиль — порог, после которого стоит отправить запрос-дубль
+  (hedged request) к запасной модели.
+"""
+import time
+from collections import deque
+
+from config import (
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_COOLDOWN,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_DEFAULT_DELAY,
+)
+from services.metrics import BREAKER_TRIPS, log_event
+
+
+class CircuitOpen(Exception):
+    """Провайдер временно отключён автоматом — запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """Разомкнут ли автомат сейчас (пробный запрос после паузы — уже «можно»)."""
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown and not self._trial_in_flight:
+            return False
+        return True
+
+    def acquire(self):
+        """Вызывается перед запросом; бросает CircuitOpen, если провайдер отключён."""
+        if self.is_open:
+            raise CircuitOpen(f"{self.name}: провайдер временно отключён после ошибок")
+        if self.opened_at is not None:
+            # Пауза прошла — пропускаем один пробный запрос
+            self._trial_in_flight = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            log_event("circuit_closed", provider=self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.opened_at is None:
+                BREAKER_TRIPS.inc(provider=self.name)
+                log_event("circuit_opened", provider=self.name, failures=self.failures, cooldown=self.cooldown)
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Запрос отменён (например, проиграл гонку hedging) — ни успех, ни ошибка."""
+        self._trial_in_flight = False
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """Через сколько секунд без ответа отправлять дубль к запасной модели."""
+        value = self.percentile(LLM_HEDGE_PERCENTILE)
+        if value is None:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, value)
+
+
+_BREAKERS: dict = {}
+_LATENCIES: dict = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _BREAKERS.get(name)
+    if breaker is None:
+        breaker = _BREAKERS[name] = CircuitBreaker(name)
+    return breaker
+
+
+def get_latency(name: str) -> LatencyTracker:
+    tracker = _LATENCIES.get(name)
+    if tracker is None:
+        tracker = _LATENCIES[name] = LatencyTracker()
+    return tracker
@@ -0,0 +1,209 @@
+# services/s3_client.py
+import io
+import gzip
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+
+from config import (
+    YC_ACCESS_KEY_ID,
+    YC_SECRET_ACCESS_KEY,
+    YC_BUCKET_NAME,
+    YC_S3_ENDPOINT,
+    S3_MAX_CONNECTIONS,
+    S3_UPLOAD_CONCURRENCY,
+    S3_MULTIPART_THRESHOLD,
+)
+from services.metrics import S3_UPLOAD_SECONDS, CACHE_HITS, CACHE_MISSES, log_event
+from services.rate_limit import call_with_retries, parse_retry_after
+
+# Один клиент на процесс: учётные данные, endpoint и пул TLS-соединений
+# настраиваются один раз, а не на каждую загрузку. boto3-клиент потокобезопасен.
+_client = None
+_client_lock = threading.Lock()
+
+_upload_semaphore: Optional[asyncio.Semaphore] = None
+
+_transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_THRESHOLD,
+)
+
+
+def get_s3_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                session = boto3.session.Session(
+                    aws_access_key_id=YC_ACCESS_KEY_ID,
+                    aws_secret_access_key=YC_SECRET_ACCESS_KEY,
+                    region_name="ru-central1",
+                )
+                _client = session.client(
+                    service_name="s3",
+                    endpoint_url=YC_S3_ENDPOINT,
+                    config=Config(
+                        signature_version="s3v4",
+                        max_pool_connections=S3_MAX_CONNECTIONS,
+                        # Повторы и лимит скорости — в общем слое services/rate_limit,
+                        # свои повторы botocore отключаем, чтобы попытки не перемножались
+                        retries={"total_max_attempts": 1},
+                    ),
+                )
+    return _client
+
+
+def _upload_bytes(body: bytes, key: str, extra_args: dict):
+    # upload_fileobj сам переключается на multipart, если тело больше multipart_threshold
+    get_s3_client().upload_fileobj(
+        io.BytesIO(body),
+        YC_BUCKET_NAME,
+        key,
+        ExtraArgs=extra_args,
+        Config=_transfer_config,
+    )
+
+
+def _upload_path(local_path: str, key: str, extra_args: dict):
+    get_s3_client().upload_file(
+        local_path,
+        YC_BUCKET_NAME,
+        key,
+        ExtraArgs=extra_args,
+        Config=_transfer_config,
+    )
+
+
+# Коды ошибок S3, которыми хранилище просит сбавить темп
+_THROTTLE_CODES = {"SlowDown", "Throttling", "ThrottlingException", "TooManyRequests", "RequestLimitExceeded", "429"}
+_RETRY_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _classify(exc: BaseException):
+    """Повторять ли вызов S3 (см. rate_limit.call_with_retries)."""
+    if isinstance(exc, ClientError):
+        error = exc.response.get("Error", {})
+        meta = exc.response.get("ResponseMetadata", {})
+        status = meta.get("HTTPStatusCode")
+        throttled = error.get("Code") in _THROTTLE_CODES or status in (429, 503)
+        if not throttled and status not in _RETRY_HTTP_STATUSES:
+            return None
+        retry_after = parse_retry_after(meta.get("HTTPHeaders", {}).get("retry-after"))
+        return throttled, retry_after
+    if isinstance(exc, (BotoConnectionError, ReadTimeoutError)):
+        return False, None
+    # upload_fileobj заворачивает ошибку части multipart в S3UploadFailedError — смотрим причину
+    cause = exc.__cause__ or exc.__context__
+    if cause is not None and cause is not exc:
+        return _classify(cause)
+    return None
+
+
+async def _call_s3(func, *args):
+    # boto3 блокирующий — уводим его из event loop в поток
+    return await call_with_retries("s3", lambda: asyncio.to_thread(func, *args), _classify)
+
+
+async def _run_upload(func, *args):
+    global _upload_semaphore
+    if _upload_semaphore is None:
+        _upload_semaphore = asyncio.Semaphore(S3_UPLOAD_CONCURRENCY)
+    async with _upload_semaphore:
+        with S3_UPLOAD_SECONDS.time():
+            await _call_s3(func, *args)
+
+
+async def upload_bytes(body: bytes, key: str, content_type: str, **extra_args):
+    """Загружает bytes в бакет под ключом key, не блокируя event loop."""
+    await _run_upload(_upload_bytes, body, key, {"ContentType": content_type, **extra_args})
+
+
+async def upload_path(local_path: str, key: str, content_type: str, **extra_args):
+    """Загружает локальный файл в бакет под ключом key, не блокируя event loop."""
+    await _run_upload(_upload_path, local_path, key, {"ContentType": content_type, **extra_args})
+
+
+# НЕИЗМЕНЯЕМЫЕ АРТЕФАКТЫ С КЛЮЧОМ ПО СОДЕРЖИМОМУ
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Ключи, про которые уже известно, что они лежат в бакете, — чтобы не делать HEAD повторно.
+# LRU с ограничением: процесс живёт долго, а ключей — по одному на каждую карту
+_KNOWN_KEYS_LIMIT = 10000
+_known_keys: OrderedDict = OrderedDict()
+
+
+def _remember_key(key: str):
+    _known_keys[key] = True
+    _known_keys.move_to_end(key)
+    while len(_known_keys) > _KNOWN_KEYS_LIMIT:
+        _known_keys.popitem(last=False)
+
+
+def _object_exists(key: str) -> bool:
+    """
+    True — только если HEAD точно нашёл объект. Любая окончательная ошибка (404, а также 403:
+    без права ListBucket хранилище отвечает 403 на отсутствующий ключ) — «нет», загружаем.
+    Временные ошибки (SlowDown, 5xx) пробрасываются — их повторит общий слой лимитов.
+    """
+    try:
+        get_s3_client().head_object(Bucket=YC_BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if _classify(e) is not None:
+            raise
+        code = e.response.get("Error", {}).get("Code")
+        if code not in ("404", "NoSuchKey", "NotFound"):
+            log_event("s3_head_failed", key=key, code=code)
+        return False
+
+
+def content_key(body: bytes, prefix: str, ext: str) -> str:
+    """Ключ вида prefix/<sha256>.ext — одинаковое содержимое всегда лежит по одному ключу."""
+    return f"{prefix}/{hashlib.sha256(body).hexdigest()}{ext}"
+
+
+async def upload_immutable(body: bytes, prefix: str, ext: str, content_type: str) -> str:
+    """
+    Загружает артефакт по ключу из хэша содержимого, сжатым gzip
+    (Content-Encoding: gzip — браузер распакует сам) и с вечным кэшированием.
+    Если такой ключ уже есть в бакете — повторно не загружаем. Возвращает ключ.
+    """
+    key = content_key(body, prefix, ext)
+    if key in _known_keys:
+        _known_keys.move_to_end(key)
+        CACHE_HITS.inc(cache="s3_key")
+        return key
+
+    try:
+        exists = await _call_s3(_object_exists, key)
+    except Exception as e:
+        # HEAD — только оптимизация: не смогли проверить — просто загружаем
+        log_event("s3_head_failed", key=key, error=str(e)[:200])
+        exists = False
+    if exists:
+        CACHE_HITS.inc(cache="s3_key")
+        _remember_key(key)
+        return key
+    CACHE_MISSES.inc(cache="s3_key")
+
+    # mtime=0 — одинаковый вход даёт побайтно одинаковый gzip
+    compressed = gzip.compress(body, mtime=0)
+    await upload_bytes(
+        compressed,
+        key,
+        content_type=content_type,
+        ContentEncoding="gzip",
+        CacheControl=IMMUTABLE_CACHE_CONTROL,
+    )
+    _remember_key(key)
+    log_event("s3_uploaded", key=key, bytes=len(body), compressed_bytes=len(compressed))
+    return key
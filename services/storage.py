@@ -1,61 +1,180 @@
-# services/storage.py
-from typing import Dict, List, Optional
-from uuid import uuid4
-from config import YC_ACCESS_KEY_ID, YC_SECRET_ACCESS_KEY, YC_BUCKET_NAME, YC_S3_ENDPOINT, YC_WEBSITE_HOST
-import boto3
-
-MAP_STORAGE: Dict[int, List[dict]] = {}
-
-
-def save_map(
-    user_id: int,
-    title: str,
-    depth: str,
-    structure: list,
-    markmap: str,
-    url: Optional[str] = None,
-) -> str:
-    map_id = str(uuid4())
-
-    MAP_STORAGE.setdefault(user_id, []).append(
-        {
-            "id": map_id,
-            "title": title,
-            "depth": depth,
-            "structure": structure,
-            "markmap": markmap,
-            "url": url,
-        }
-    )
-
-    return map_id
-
-def upload_to_s3(md_content: str, filename: str) -> str:
-    """Uploads Markdown to S3 and returns path for Mini App"""
-    session = boto3.session.Session(
-        aws_access_key_id=YC_ACCESS_KEY_ID,
-        aws_secret_access_key=YC_SECRET_ACCESS_KEY,
-        region_name="ru-central1"
-    )
-    s3 = session.client(service_name="s3", endpoint_url=YC_S3_ENDPOINT)
-    
-    s3_key = f"generated_maps/{filename}"
-    
-    s3.put_object(
-        Bucket=YC_BUCKET_NAME,
-        Key=s3_key,
-        Body=md_content.encode('utf-8'),
-        ContentType='text/markdown; charset=utf-8'
-    )
-    
-    return f"http://{YC_WEBSITE_HOST}/index.html?file={s3_key}"
-
-def get_user_maps(user_id: int) -> List[dict]:
-    return MAP_STORAGE.get(user_id, [])
-
-
-def get_last_map(user_id: int) -> Optional[dict]:
-    maps = MAP_STORAGE.get(user_id) or []
-    return maps[-1] if maps else None
-
-
+# services/storage.py
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Optional
+from uuid import uuid4
+from config import YC_WEBSITE_HOST, MAPS_DB_PATH, HISTORY_PAGE_SIZE
+from services.s3_client import upload_immutable
+
+# Карты хранятся в SQLite (WAL): метаданные — в колонках с индексами,
+# structure + markmap — одним сжатым JSON-блобом, который читается только по запросу.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    title TEXT,
+    depth TEXT,
+    url TEXT,
+    created_at INTEGER NOT NULL,
+    payload BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_maps_user_created ON maps (user_id, created_at);
+"""
+
+_META_COLUMNS = "id, user_id, title, depth, url, created_at"
+
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+
+def _get_db() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        directory = os.path.dirname(MAPS_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(MAPS_DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _db = conn
+    return _db
+
+
+def _pack(structure: list, markmap: str) -> bytes:
+    data = json.dumps({"structure": structure, "markmap": markmap}, ensure_ascii=False)
+    return zlib.compress(data.encode("utf-8"))
+
+
+def _row_to_map(row: sqlite3.Row, with_payload: bool = False) -> dict:
+    item = {
+        "id": row["id"],
+        "title": row["title"],
+        "depth": row["depth"],
+        "url": row["url"],
+        "created_at": row["created_at"],
+    }
+    if with_payload:
+        payload = json.loads(zlib.decompress(row["payload"]).decode("utf-8")) if row["payload"] else {}
+        item["structure"] = payload.get("structure", [])
+        item["markmap"] = payload.get("markmap", "")
+    return item
+
+
+def save_map(
+    user_id: int,
+    title: str,
+    depth: str,
+    structure: list,
+    markmap: str,
+    url: Optional[str] = None,
+) -> str:
+    map_id = str(uuid4())
+
+    with _db_lock:
+        db = _get_db()
+        db.execute(
+            "INSERT INTO maps (id, user_id, title, depth, url, created_at, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (map_id, user_id, title, depth, url, time.time_ns(), _pack(structure, markmap)),
+        )
+        db.commit()
+
+    return map_id
+
+async def upload_to_s3(md_content: str) -> str:
+    """
+    Uploads Markdown to S3 and returns path for Mini App.
+    Key is the content hash, so the same map is stored once and cached forever.
+    """
+    s3_key = await upload_immutable(
+        md_content.encode('utf-8'),
+        prefix="generated_maps",
+        ext=".md",
+        content_type='text/markdown; charset=utf-8',
+    )
+    
+    return f"http://{YC_WEBSITE_HOST}/index.html?file={s3_key}"
+
+async def upload_tree_to_s3(tree: dict) -> str:
+    """
+    Uploads the pre-built markmap JSON tree (see services.llm.markmap_tree)
+    and returns path for Mini App — the viewer renders it without markmap-lib.
+    """
+    body = json.dumps(tree, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+    s3_key = await upload_immutable(
+        body,
+        prefix="generated_maps",
+        ext=".json",
+        content_type='application/json; charset=utf-8',
+    )
+
+    return f"http://{YC_WEBSITE_HOST}/index.html?file={s3_key}"
+
+
+def get_user_maps_page(
+    user_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> dict:
+    """
+    Страница истории, новые карты сверху. Курсор — created_at:
+    before=c — карты старше c, after=c — карты новее c, без курсора — самые новые.
+    Возвращает {"maps": [...], "older": курсор или None, "newer": курсор или None}.
+    Каждая страница — один проход по индексу (user_id, created_at), независимо от длины истории.
+    """
+    if after is not None:
+        query = f"SELECT {_META_COLUMNS} FROM maps WHERE user_id = ? AND created_at > ? ORDER BY created_at ASC LIMIT ?"
+        params = (user_id, after, limit + 1)
+    elif before is not None:
+        query = f"SELECT {_META_COLUMNS} FROM maps WHERE user_id = ? AND created_at < ? ORDER BY created_at DESC LIMIT ?"
+        params = (user_id, before, limit + 1)
+    else:
+        query = f"SELECT {_META_COLUMNS} FROM maps WHERE user_id = ? ORDER BY created_at DESC LIMIT ?"
+        params = (user_id, limit + 1)
+
+    with _db_lock:
+        rows = _get_db().execute(query, params).fetchall()
+
+    has_more = len(rows) > limit
+    maps = [_row_to_map(row) for row in rows[:limit]]
+
+    if after is not None:
+        maps.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = before is not None, has_more
+
+    return {
+        "maps": maps,
+        "older": maps[-1]["created_at"] if maps and has_older else None,
+        "newer": maps[0]["created_at"] if maps and has_newer else None,
+    }
+
+
+def get_map(user_id: int, map_id: str) -> Optional[dict]:
+    """Одна карта целиком (со structure и markmap) — поиск по первичному ключу."""
+    with _db_lock:
+        row = _get_db().execute(
+            f"SELECT {_META_COLUMNS}, payload FROM maps WHERE id = ? AND user_id = ?",
+            (map_id, user_id),
+        ).fetchone()
+    return _row_to_map(row, with_payload=True) if row else None
+
+
+def get_last_map(user_id: int) -> Optional[dict]:
+    """Последняя карта пользователя — только метаданные: меню нужен лишь её url."""
+    with _db_lock:
+        row = _get_db().execute(
+            f"SELECT {_META_COLUMNS} FROM maps WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+            (user_id,),
+        ).fetchone()
+    return _row_to_map(row) if row else None
+
+
@@ -0,0 +1,88 @@
+# services/stream_parser.py
+import json
+
+
+class TreeStreamParser:
+    """
+    Инкрементальный разбор JSON-карты вида {"title": ..., "nodes": [{"title": ...}, ...]},
+    который приходит от LLM кусками.
+
+    Полный JSON не собираем — только отслеживаем вложенность и вытаскиваем
+    заголовок карты и заголовки узлов верхнего уровня, как только строка закрылась.
+    Каждый символ обрабатывается один раз, поэтому стоимость линейна по длине ответа.
+    """
+
+    def __init__(self):
+        self.title = None
+        self.top_level = []
+        # стек контейнеров: [тип ("{" / "["), ключ, под которым контейнер лежит в родителе]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._buf = []
+        # в объекте: последняя прочитанная строка, ждём ли значение после ":"
+        self._last_key = None
+        self._expect_value = False
+        self._keys = []
+
+    def feed(self, chunk: str) -> list[str]:
+        """Скармливаем очередной кусок ответа, возвращаем новые узлы верхнего уровня."""
+        new_titles = []
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._buf.append(ch)
+                    self._escape = False
+                elif ch == "\\":
+                    self._buf.append(ch)
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string(self._decode("".join(self._buf)), new_titles)
+                    self._buf = []
+                else:
+                    self._buf.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == ":":
+                self._expect_value = True
+            elif ch in "{[":
+                key = self._last_key if self._expect_value else None
+                self._stack.append((ch, key))
+                self._keys.append(self._last_key)
+                self._last_key = None
+                self._expect_value = False
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                    self._last_key = self._keys.pop()
+                self._expect_value = False
+            elif ch == ",":
+                self._expect_value = False
+        return new_titles
+
+    def _on_string(self, value: str, new_titles: list):
+        in_object = bool(self._stack) and self._stack[-1][0] == "{"
+        if in_object and not self._expect_value:
+            self._last_key = value
+            return
+
+        self._expect_value = False
+        if not in_object or self._last_key != "title":
+            return
+
+        depth = len(self._stack)
+        if depth == 1:
+            self.title = value
+        elif depth == 3 and self._stack[1] == ("[", "nodes"):
+            self.top_level.append(value)
+            new_titles.append(value)
+
+    @staticmethod
+    def _decode(raw: str) -> str:
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
@@ -0,0 +1,156 @@
+# services/text_normalize.py
+"""
+Чистка текста перед промптом и оценка его размера в токенах.
+
+- strip_page_boilerplate: убирает колонтитулы, повторяющиеся от страницы к странице,
+  и номера страниц (нужны тексты постранично — PDF и OCR сканов);
+- normalize_text: склеивает переносы, схлопывает пробелы и пустые строки
+  (на любом тексте — DOCX, PPTX, TXT, фото);
+- estimate_tokens / trim_to_tokens: грубая оценка токенов под токенизатор модели
+  и обрезка текста под её бюджет.
+
+Всё, что выброшено здесь, модель не читает — меньше входных токенов,
+быстрее и дешевле ответ.
+"""
+import re
+from collections import Counter
+
+# Строка — только номер страницы: "12", "- 12 -", "12 / 40", "Стр. 12", "Page 12 of 40".
+# Голое число — не длиннее 3 цифр: "2023" на титуле или в шапке отчёта — год, а не номер страницы
+_PAGE_NUMBER_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:стр(?:аница)?|page|p)\.?\s*[-–—]?\s*\d{1,4}\s*[-–—]?\s*(?:(?:/|из|of)\s*\d{1,4})?"
+    r"|\d{1,4}\s*(?:/|из|of)\s*\d{1,4}"
+    r"|[-–—]?\s*\d{1,3}\s*[-–—]?"
+    r")\s*$",
+    re.IGNORECASE,
+)
+
+# Сколько строк сверху и снизу страницы проверять на колонтитулы
+_EDGE_LINES = 3
+# Колонтитул — строка (с точностью до цифр), которая есть хотя бы на такой доле страниц
+_BOILERPLATE_SHARE = 0.5
+_BOILERPLATE_MIN_PAGES = 3
+# По скольким первым страницам определяем колонтитулы
+_SAMPLE_PAGES = 20
+
+
+def _line_shape(line: str) -> str:
+    """Строка без цифр и лишних пробелов: «Глава 3 · стр. 17» и «Глава 3 · стр. 18» совпадут."""
+    return re.sub(r"\d+", "#", " ".join(line.split())).lower()
+
+
+def _edge_lines(page: str) -> list[str]:
+    lines = [line for line in page.splitlines() if line.strip()]
+    if len(lines) <= 2 * _EDGE_LINES:
+        return lines
+    return lines[:_EDGE_LINES] + lines[-_EDGE_LINES:]
+
+
+def _learn_boilerplate(pages: list[str]) -> set[str]:
+    if len(pages) < _BOILERPLATE_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for page in pages:
+        counts.update({_line_shape(line) for line in _edge_lines(page)})
+    threshold = max(_BOILERPLATE_MIN_PAGES, len(pages) * _BOILERPLATE_SHARE)
+    return {shape for shape, n in counts.items() if n >= threshold}
+
+
+def _clean_page(page: str, boilerplate: set[str]) -> str:
+    lines = page.splitlines()
+    edge = _edge_lines(page)
+    # Номер страницы ищем только в самой первой и самой последней строке:
+    # число посреди страницы — скорее ячейка таблицы или год
+    first_last = {edge[0], edge[-1]} if edge else set()
+    edge = set(edge)
+    kept = []
+    for line in lines:
+        if line in edge and _line_shape(line) in boilerplate:
+            continue
+        if line in first_last and _PAGE_NUMBER_RE.match(line):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_page_boilerplate(pages):
+    """
+    Генератор: отдаёт страницы без колонтитулов и номеров страниц.
+    Колонтитулы определяются по первым _SAMPLE_PAGES страницам, остальные
+    страницы читаются лениво — бюджет извлечения по-прежнему работает.
+    """
+    pages = iter(pages)
+    sample = []
+    for page in pages:
+        sample.append(page)
+        if len(sample) >= _SAMPLE_PAGES:
+            break
+
+    boilerplate = _learn_boilerplate(sample)
+    for page in sample:
+        yield _clean_page(page, boilerplate)
+    for page in pages:
+        yield _clean_page(page, boilerplate)
+
+
+# Перенос слова в конце строки: «информа-\nция» → «информация».
+# Только буква-дефис-перевод строки-строчная буква, чтобы не склеить «Москва -\nСанкт-Петербург».
+_HYPHENATION_RE = re.compile(r"(\w)[-\u00ad]\n[ \t]*([a-zа-яё])")
+_SOFT_HYPHEN_RE = re.compile("\u00ad")
+_SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """Склеивает переносы, схлопывает пробелы и пустые строки."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _HYPHENATION_RE.sub(r"\1\2", text)
+    text = _SOFT_HYPHEN_RE.sub("", text)
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+# ОЦЕНКА ТОКЕНОВ
+#
+# Точный токенизатор каждой модели тянуть в бота дорого (и для части моделей его нет),
+# поэтому считаем по средней длине токена для кириллицы и для остального текста.
+# Значения с запасом в меньшую сторону: лучше недобрать бюджет, чем упереться в контекст.
+
+# model_id -> (символов кириллицы на токен, прочих символов на токен)
+CHARS_PER_TOKEN = {
+    "yandexgpt": (3.5, 3.5),
+    "openai/gpt-4o-mini": (3.0, 4.0),
+    "google/gemini-3-flash-preview": (3.0, 4.0),
+}
+DEFAULT_CHARS_PER_TOKEN = (2.5, 3.5)
+
+_CYRILLIC_RE = re.compile(r"[а-яёА-ЯЁ]")
+
+
+def estimate_tokens(text: str, model_id: str) -> int:
+    cyr_ratio, other_ratio = CHARS_PER_TOKEN.get(model_id, DEFAULT_CHARS_PER_TOKEN)
+    cyrillic = len(_CYRILLIC_RE.findall(text))
+    other = len(text) - cyrillic
+    return int(cyrillic / cyr_ratio + other / other_ratio) + 1
+
+
+def trim_to_tokens(text: str, model_id: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens (по оценке) с конца, по границе абзаца или строки.
+    Текст в пределах бюджета возвращается как есть.
+    """
+    tokens = estimate_tokens(text, model_id)
+    if tokens <= max_tokens:
+        return text
+
+    # Доля текста, которая влезает в бюджет, → позиция реза; дальше ищем ближайшую границу
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0 and estimate_tokens(text[:cut], model_id) > max_tokens:
+        cut = int(cut * 0.95)
+    head = text[:cut]
+    for sep in ("\n\n", "\n"):
+        boundary = head.rfind(sep)
+        if boundary > cut // 2:
+            return head[:boundary].rstrip()
+    return head.rstrip()
@@ -1,77 +1,58 @@
-import os
-import boto3
-from botocore.client import Config
-from botocore.exceptions import NoCredentialsError
-
-from config import (
-    YC_ACCESS_KEY_ID,
-    YC_SECRET_ACCESS_KEY,
-    YC_BUCKET_NAME,
-    YC_S3_ENDPOINT,
-    YC_WEBSITE_HOST,
-)
-
-_session = boto3.session.Session(
-    aws_access_key_id=YC_ACCESS_KEY_ID,
-    aws_secret_access_key=YC_SECRET_ACCESS_KEY,
-    region_name="ru-central1",
-)
-
-_s3 = _session.resource(
-    service_name="s3",
-    endpoint_url=YC_S3_ENDPOINT,
-    config=Config(signature_version="s3v4"),
-)
-
-def upload_map_html(local_path: str, object_key: str) -> str:
-    """
-    Загружает HTML-файл в Object Storage и возвращает публичный URL.
-    object_key: например 'maps/unique_id.html'
-    """
-    if not os.path.isfile(local_path):
-        raise FileNotFoundError(f"Файл не найден: {local_path}")
-
-    bucket = _s3.Bucket(YC_BUCKET_NAME)
-    
-    try:
-        bucket.upload_file(
-            local_path,
-            object_key,
-            ExtraArgs={
-                "ACL": "public-read", 
-                "ContentType": "text/html; charset=utf-8",
-                "CacheControl": "max-age=0" 
-            },
-        )
-    except Exception as e:
-        print(f"Ошибка загрузки в S3: {e}")
-        raise e
-
-    # Формируем ссылку на статический сайт
-    return f"https://{YC_WEBSITE_HOST}/{object_key}"
-
-def upload_html_to_s3(html_content: bytes, filename: str) -> str:
-    """Загружает готовый HTML в S3 с правильным заголовком"""
-    session = boto3.session.Session(
-        aws_access_key_id=YC_ACCESS_KEY_ID,
-        aws_secret_access_key=YC_SECRET_ACCESS_KEY,
-        region_name="ru-central1"
-    )
-    s3 = session.client(service_name="s3", endpoint_url=YC_S3_ENDPOINT)
-    
-    # Можно складывать в отдельную папку, например uploaded_html
-    s3_key = f"uploaded_html/{filename}"
-    
-    s3.put_object(
-        Bucket=YC_BUCKET_NAME,
-        Key=s3_key,
-        Body=html_content,
-        ContentType='text/html; charset=utf-8' # Ключевой момент для открытия в WebApp
-    )
-    
-    # Формируем публичную ссылку
-    clean_host = YC_WEBSITE_HOST.replace("https://", "").replace("http://", "").strip("/")
-    
-    # Возвращаем ссылку вида https://site.com/index.html?file=uploaded_html/file.html
-    # ИЛИ, если HTML самодостаточный (не требует viewer'а), прямую ссылку:
-    return f"https://{clean_host}/{s3_key}"
+import os
+import logging
+
+from config import YC_WEBSITE_HOST
+from services.s3_client import upload_immutable, upload_path
+from services.metrics import log_event
+
+
+async def upload_map_html(local_path: str, object_key: str | None = None) -> str:
+    """
+    Загружает HTML-файл в Object Storage и возвращает публичный URL.
+    object_key: например 'maps/unique_id.html' — перезаписываемый объект без кэширования;
+    без object_key файл кладётся по хэшу содержимого, сжатым и с вечным кэшем.
+    """
+    if not os.path.isfile(local_path):
+        raise FileNotFoundError(f"Файл не найден: {local_path}")
+
+    try:
+        if object_key is None:
+            with open(local_path, "rb") as f:
+                object_key = await upload_immutable(
+                    f.read(),
+                    prefix="maps",
+                    ext=".html",
+                    content_type="text/html; charset=utf-8",
+                )
+        else:
+            await upload_path(
+                local_path,
+                object_key,
+                content_type="text/html; charset=utf-8",
+                ACL="public-read",
+                CacheControl="max-age=0",
+            )
+    except Exception as e:
+        log_event("s3_upload_error", logging.ERROR, key=object_key, error=str(e))
+        raise e
+
+    # Формируем ссылку на статический сайт
+    return f"https://{YC_WEBSITE_HOST}/{object_key}"
+
+async def upload_html_to_s3(html_content: bytes) -> str:
+    """Загружает готовый HTML в S3 с правильным заголовком"""
+    # Можно складывать в отдельную папку, например uploaded_html.
+    # Ключ — хэш содержимого: одинаковый файл хранится один раз
+    s3_key = await upload_immutable(
+        html_content,
+        prefix="uploaded_html",
+        ext=".html",
+        content_type='text/html; charset=utf-8' # Ключевой момент для открытия в WebApp
+    )
+    
+    # Формируем публичную ссылку
+    clean_host = YC_WEBSITE_HOST.replace("https://", "").replace("http://", "").strip("/")
+    
+    # Возвращаем ссылку вида https://site.com/index.html?file=uploaded_html/file.html
+    # ИЛИ, если HTML самодостаточный (не требует viewer'а), прямую ссылку:
+    return f"https://{clean_host}/{s3_key}"